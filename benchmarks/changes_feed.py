@@ -0,0 +1,128 @@
+"""
+Compare continuous changes feed readers: the old `iter_lines(chunk_size=1)`
+reader against `cloudant.stream.iter_available`.
+
+Serves a synthetic continuous feed from a local HTTP server, one HTTP chunk
+per change like CouchDB, and counts how many changes per second each reader
+decodes. Run it from the repository root:
+
+    python benchmarks/changes_feed.py [--changes N] [--rate CHANGES_PER_SEC]
+
+With `--rate`, the server paces the feed in 10ms bursts to approximate a
+busy database; without it, the feed is sent as fast as possible.
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import requests
+from cloudant.stream import iter_available, iter_lines
+
+
+def make_change(seq):
+    return {
+        'seq': '%d-g1AAAAEzeJzLYWBgYMlgTmGQT0lKzi9KdUhJMtJLSs3NSy3JyM_',
+        'id': 'a4d6f1b2c3e5%020d' % seq,
+        'changes': [{'rev': '1-967a00dff5e02add41819138abb3284d'}]
+    }
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        count, rate = self.server.changes, self.server.rate
+        burst = max(1, rate // 100) if rate else count
+        lines = [(json.dumps(make_change(seq)) + '\n').encode('utf-8')
+                 for seq in range(burst)]
+        sent = 0
+        start = time.time()
+        while sent < count:
+            for line in lines[:count - sent]:
+                self.wfile.write(b'%x\r\n%s\r\n' % (len(line), line))
+            sent += min(burst, count - sent)
+            self.wfile.flush()
+            if rate:
+                delay = start + float(sent) / rate - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+        last = json.dumps({'last_seq': count}).encode('utf-8') + b'\n'
+        self.wfile.write(b'%x\r\n%s\r\n0\r\n\r\n' % (len(last), last))
+
+
+class Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def old_reader(response):
+    """How `Database.changes` read continuous feeds before."""
+    for line in response.iter_lines(chunk_size=1):
+        if not line:
+            continue
+        line = line.decode('utf-8')
+        if line[-1] == ',':
+            line = line[:-1]
+        yield json.loads(line)
+
+
+def new_reader(response):
+    """How `Database.changes` reads continuous feeds now."""
+    for line in iter_lines(iter_available(response)):
+        if not line:
+            continue
+        line = line.decode('utf-8')
+        if line[-1] == ',':
+            line = line[:-1]
+        yield json.loads(line)
+
+
+def measure(url, reader):
+    start = time.time()
+    response = requests.get(url, stream=True)
+    count = sum(1 for change in reader(response) if 'seq' in change)
+    return count, count / (time.time() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--changes', type=int, default=50000)
+    parser.add_argument('--rate', type=int, default=0,
+                        help='changes per second to serve; 0 for unlimited')
+    args = parser.parse_args()
+
+    server = Server(('127.0.0.1', 0), Handler)
+    server.changes, server.rate = args.changes, args.rate
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    url = 'http://127.0.0.1:%d/db/_changes' % server.server_address[1]
+
+    print('%d changes, rate %s' % (args.changes, args.rate or 'unlimited'))
+    for name, reader in [('iter_lines(chunk_size=1)', old_reader),
+                         ('iter_available', new_reader)]:
+        count, per_second = measure(url, reader)
+        print('%-26s %8d changes  %10.0f changes/sec' % (name, count, per_second))
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
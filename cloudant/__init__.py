@@ -1,10 +1,25 @@
 from .resource import Resource
+from .codec import Codec, get_codec
+from .pool import ConnectionPools, configure_pools
 from .account import Account
 from .database import Database
 from .document import Document
 from .design import Design
 from .attachment import Attachment
 from .index import Index
+from .search import SearchIndex
+from .cache import DocumentCache, QueryCache
+from .compression import Compression, Transfer
+from .bulk import BulkWriter, MISSING, DELETED
+from .changes import ChangesFollower, ChangesProcessor, FileCheckpoint, LocalDocumentCheckpoint
+from .replicator import Replicator
+from .query import Query, UnindexedQueryError
+
+try:
+    from .aio import AsyncAccount, AsyncDatabase, AsyncDocument, AsyncDesign, AsyncIndex, AsyncSession
+except SyntaxError:
+    # the asyncio client needs python 3.6+
+    pass
 
 import warnings
 message = """
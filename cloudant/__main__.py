@@ -0,0 +1,114 @@
+"""
+Back up and restore databases from the command line:
+
+    python -m cloudant dump http://localhost:5984/db db.ndjson.gz
+    python -m cloudant load http://localhost:5984/copy db.ndjson.gz --create
+
+Dumps are gzipped NDJSON when the path ends in `.gz`, and plain NDJSON
+otherwise, unless `--compress` says so. A path of `-` means standard
+output or input. Pass `--resume` to continue a dump that was cut off,
+from the last document it wrote.
+"""
+import argparse
+import sys
+
+from .database import Database
+from . import backup
+
+
+def _binary(stream):
+    # python 3's standard streams are text; their buffers are binary
+    return getattr(stream, 'buffer', stream)
+
+
+def _report(progress):
+    sys.stderr.write('\r%d docs, %.1f docs/s, %.1fs' % (
+        progress.docs, progress.docs_per_sec, progress.elapsed))
+    sys.stderr.flush()
+
+
+def dump(args, database, compress):
+    if args.path == '-':
+        return database.dump(_binary(sys.stdout), **dict(args.options, compress=compress))
+    after = backup.last_id(args.path, compress) if args.resume else None
+    with open(args.path, 'ab' if args.resume else 'wb') as f:
+        return database.dump(f, after=after, **dict(args.options, compress=compress))
+
+
+def load(args, database, compress):
+    if args.create:
+        response = database.put()
+        if response.status_code != 412:
+            response.raise_for_status()
+    if args.path == '-':
+        return database.load(_binary(sys.stdin), **dict(args.options, compress=compress))
+    with open(args.path, 'rb') as f:
+        return database.load(f, **dict(args.options, compress=compress))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m cloudant',
+                                     description='Back up and restore databases as NDJSON.')
+    commands = parser.add_subparsers(dest='command')
+
+    def command(name, help):
+        sub = commands.add_parser(name, help=help)
+        sub.add_argument('url', help='the database URL, with any credentials')
+        sub.add_argument('path', help='the dump file, or - for standard output or input')
+        sub.add_argument('--compress', choices=['gzip', 'none'],
+                         help='defaults to gzip for paths ending in .gz')
+        sub.add_argument('--quiet', action='store_true', help="don't report progress")
+        return sub
+
+    sub = command('dump', 'write every document to a file')
+    sub.add_argument('--attachments', action='store_true', help='include attachments')
+    sub.add_argument('--partitions', type=int, default=4,
+                     help='ID ranges to read in parallel (default 4)')
+    sub.add_argument('--resume', action='store_true',
+                     help='append to the file, after its last document')
+
+    sub = command('load', 'save every document in a file')
+    sub.add_argument('--create', action='store_true', help='create the database first')
+    sub.add_argument('--new-edits', action='store_true',
+                     help='save new revisions instead of the dumped ones')
+    sub.add_argument('--batch-size', type=int, default=500,
+                     help='documents per _bulk_docs request (default 500)')
+    sub.add_argument('--concurrency', type=int, default=4,
+                     help='_bulk_docs requests in flight (default 4)')
+
+    args = parser.parse_args(argv)
+    if args.command is None:
+        parser.error('choose a command: dump or load')
+    if args.command == 'dump':
+        args.options = {'include_attachments': args.attachments,
+                        'partitions': args.partitions}
+    else:
+        args.options = {'new_edits': args.new_edits, 'batch_size': args.batch_size,
+                        'concurrency': args.concurrency}
+    if not args.quiet:
+        args.options['progress'] = _report
+
+    if args.compress is None:
+        compress = 'gzip' if args.path.endswith('.gz') else None
+    else:
+        compress = None if args.compress == 'none' else args.compress
+    database = Database(args.url)
+    progress = (dump if args.command == 'dump' else load)(args, database, compress)
+    if not args.quiet:
+        sys.stderr.write('\n')
+    if progress.dropped_attachments:
+        sys.stderr.write('warning: %d documents were dumped without their attachments, '
+                         'so loading them will give them new revisions; '
+                         'use --attachments to keep them\n' % progress.dropped_attachments)
+    if progress.new_revisions:
+        sys.stderr.write('warning: %d documents were dumped without their attachments, '
+                         'and were saved as new revisions\n' % progress.new_revisions)
+    if progress.errors:
+        for error in progress.errors:
+            sys.stderr.write('%s: %s\n' % (error.get('id'), error.get('reason') or error['error']))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,10 +1,232 @@
+import io
+import mmap
+import os
+import re
+
+import requests
+
 from .resource import Resource
 
+try:
+    string_types = (basestring,)
+except NameError:
+    string_types = (str, bytes)
+
+
+class _MemoryBody(object):
+
+    """
+    A request body that sends a buffer, such as an `mmap`,
+    in `memoryview` slices, so it's never copied into bytes.
+    """
+
+    def __init__(self, buffer, chunk_size):
+        # fail early if `buffer` can't be viewed
+        memoryview(buffer).release()
+        self.buffer = buffer
+        self.chunk_size = chunk_size
+
+    def __len__(self):
+        return len(self.buffer)
+
+    def __iter__(self):
+        view = memoryview(self.buffer)
+        try:
+            for start in range(0, len(view), self.chunk_size):
+                with view[start:start + self.chunk_size] as chunk:
+                    yield chunk
+        finally:
+            view.release()
+
 
 class Attachment(Resource):
 
     """
-    Attachment methods for a single document
+    Attachment methods for a single document. Besides the usual HTTP
+    methods, attachments can be streamed to and from files, so memory
+    use stays the same no matter how big they are:
+
+        attachment = db['video'].attachment('video.mp4')
+        attachment.upload('video.mp4', 'video/mp4', rev=rev)
+        attachment.download('copy.mp4')
+        with attachment.open() as f:
+            f.seek(1024)
+            header = f.read(64)
     """
 
-    pass  # lawl everything is defined by the parent class :D
+    chunk_size = 65536
+
+    def upload(self, source, content_type='application/octet-stream', rev=None, **kwargs):
+        """
+        Upload the attachment from `source`, streaming its contents.
+        `source` can be a path, which is memory-mapped, an `mmap`,
+        or any file object opened in binary mode, which is read from
+        its current position. `rev` is the document's current revision,
+        if it exists. `kwargs` are passed to the request.
+        """
+        opened = []
+        if isinstance(source, string_types) or hasattr(source, '__fspath__'):
+            source = open(source, 'rb')
+            opened.append(source)
+            if os.fstat(source.fileno()).st_size:
+                source = mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ)
+                opened.append(source)
+            else:
+                # empty files can't be mapped
+                source = b''
+        data = source
+        if isinstance(source, mmap.mmap):
+            try:
+                data = _MemoryBody(source, self.chunk_size)
+            except TypeError:
+                # python 2's mmap has no buffer interface, but it can be read
+                pass
+
+        headers = dict(self.opts.get('headers', {}), **kwargs.pop('headers', {}))
+        headers['Content-Type'] = content_type
+        params = dict(kwargs.pop('params', {}))
+        if rev:
+            params['rev'] = rev
+
+        def close(*args):
+            for f in reversed(opened):
+                f.close()
+
+        try:
+            response = self.put(data=data, headers=headers, params=params, **kwargs)
+        except Exception:
+            close()
+            raise
+        if hasattr(response, 'add_done_callback'):
+            # the upload is still running, so close the file once it's done
+            response.add_done_callback(close)
+        else:
+            close()
+        return response
+
+    def download(self, dest, chunk_size=None, **kwargs):
+        """
+        Download the attachment into `dest`, a path or a file object
+        opened in binary mode, `chunk_size` bytes at a time.
+        Returns the number of bytes written.
+        """
+        response = self.get(stream=True, **kwargs)
+        # block until result if the object is using async/is a future
+        if hasattr(response, 'result'):
+            response = response.result()
+        try:
+            response.raise_for_status()
+            f = open(dest, 'wb') if not hasattr(dest, 'write') else dest
+            try:
+                written = 0
+                for chunk in response.iter_content(chunk_size or self.chunk_size):
+                    f.write(chunk)
+                    written += len(chunk)
+            finally:
+                if f is not dest:
+                    f.close()
+        finally:
+            response.close()
+        return written
+
+    def open(self, rev=None, buffer_size=None):
+        """
+        Open the attachment for reading, returning a buffered, seekable
+        file object. Reads after a seek fetch only the bytes they need,
+        using HTTP `Range` requests. `rev` pins a revision of the document.
+        """
+        raw = AttachmentFile(self, rev=rev)
+        return io.BufferedReader(raw, buffer_size or self.chunk_size)
+
+
+class AttachmentFile(io.RawIOBase):
+
+    """
+    A read-only, seekable, unbuffered file over an attachment.
+    Use it through `Attachment.open`. Reading streams from the current
+    position until the next seek, which opens a new `Range` request.
+    """
+
+    def __init__(self, attachment, rev=None):
+        super(AttachmentFile, self).__init__()
+        self.attachment = attachment
+        self.params = {'rev': rev} if rev else {}
+        self._position = 0
+        self._response = None
+        response = self._request('head')
+        response.raise_for_status()
+        self.size = int(response.headers['Content-Length'])
+        self.content_type = response.headers.get('Content-Type')
+
+    def _request(self, method, **kwargs):
+        headers = dict(self.attachment.opts.get('headers', {}),
+                       **kwargs.pop('headers', {}))
+        # byte ranges must refer to the stored bytes, not a compressed copy
+        headers['Accept-Encoding'] = 'identity'
+        response = getattr(self.attachment, method)(
+            params=dict(self.params), headers=headers, **kwargs)
+        # block until result if the object is using async/is a future
+        if hasattr(response, 'result'):
+            response = response.result()
+        return response
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            position = offset
+        elif whence == io.SEEK_CUR:
+            position = self._position + offset
+        elif whence == io.SEEK_END:
+            position = self.size + offset
+        else:
+            raise ValueError("Invalid whence (%r)" % whence)
+        if position < 0:
+            raise ValueError("Negative seek position %d" % position)
+        if position != self._position:
+            self._close_response()
+            self._position = position
+        return self._position
+
+    def readinto(self, buffer):
+        if self._position >= self.size or not len(buffer):
+            return 0
+        if self._response is None:
+            self._open_response()
+        count = self._response.raw.readinto(buffer)
+        if not count:
+            raise requests.ConnectionError(
+                'Connection closed at byte %d of %d' % (self._position, self.size))
+        self._position += count
+        return count
+
+    def _open_response(self):
+        headers = {}
+        if self._position:
+            headers['Range'] = 'bytes=%d-' % self._position
+        response = self._request('get', headers=headers, stream=True)
+        response.raise_for_status()
+        if self._position and response.status_code != 206:
+            response.close()
+            raise requests.HTTPError('Server ignored the Range request', response=response)
+        match = re.match(r'bytes (\d+)-', response.headers.get('Content-Range', ''))
+        if self._position and (not match or int(match.group(1)) != self._position):
+            response.close()
+            raise requests.HTTPError('Server returned the wrong range', response=response)
+        self._response = response
+
+    def _close_response(self):
+        if self._response is not None:
+            self._response.close()
+            self._response = None
+
+    def close(self):
+        self._close_response()
+        super(AttachmentFile, self).close()
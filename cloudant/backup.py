@@ -0,0 +1,195 @@
+import gzip
+import json
+import os
+import time
+import zlib
+from itertools import islice
+
+
+class Progress(object):
+
+    """
+    Counts the documents a dump or load has handled so far, and the ID
+    of the last one. `dropped_attachments` counts the documents a dump
+    wrote without their attachments, and `new_revisions` those a load
+    saved as new revisions. If `callback` is set, it's called with the
+    `Progress` at most once every `interval` seconds, and once at the end:
+
+        def report(progress):
+            print progress
+            # <Progress 12000 docs, 3150.2 docs/s>
+
+        db.dump(f, progress=report)
+    """
+
+    def __init__(self, callback=None, interval=1.0):
+        self.callback = callback
+        self.interval = interval
+        self.docs = 0
+        self.last_id = None
+        self.errors = []
+        self.dropped_attachments = 0
+        self.new_revisions = 0
+        self.started = time.time()
+        self._reported = self.started
+
+    def __repr__(self):
+        return '<Progress %d docs, %.1f docs/s>' % (self.docs, self.docs_per_sec)
+
+    @property
+    def elapsed(self):
+        """Seconds since the dump or load started."""
+        return time.time() - self.started
+
+    @property
+    def docs_per_sec(self):
+        """The average number of documents handled per second."""
+        elapsed = self.elapsed
+        return self.docs / elapsed if elapsed > 0 else 0.0
+
+    def update(self, last_id=None):
+        """Count one more document, reporting progress if it's time to."""
+        self.docs += 1
+        if last_id is not None:
+            self.last_id = last_id
+        if self.callback is not None:
+            now = time.time()
+            if now - self._reported >= self.interval:
+                self._reported = now
+                self.callback(self)
+
+    def finish(self):
+        if self.callback is not None:
+            self.callback(self)
+
+
+def _open(fileobj, mode, compress):
+    """Wrap `fileobj` to compress or decompress it with `compress`."""
+    if compress is None:
+        return fileobj
+    if compress == 'gzip':
+        return gzip.GzipFile(fileobj=fileobj, mode=mode)
+    raise ValueError("Unknown compression %r; use 'gzip' or None" % (compress,))
+
+
+def dump(database, fileobj, compress='gzip', include_attachments=False,
+         after=None, partitions=4, workers=None, progress=None, interval=1.0):
+    """
+    Write every document in `database` to `fileobj` as NDJSON.
+    See `Database.dump`.
+    """
+    tracker = Progress(progress, interval)
+    query = {'include_docs': True}
+    if include_attachments:
+        query['attachments'] = True
+    if after is not None:
+        query['startkey'] = after
+    index = database.all_docs()
+    scan = index.parallel_scan(partitions=partitions, workers=workers, **query)
+    encode = database.codec.encode
+    stream = _open(fileobj, 'wb', compress)
+    try:
+        for row in scan:
+            if row['id'] == after:
+                continue
+            doc = row['doc']
+            if not include_attachments and doc.pop('_attachments', None):
+                # stubs can't be restored without the attachments they stand
+                # for, and the revision no longer describes what's left, so
+                # the document has to be loaded as a new revision
+                del doc['_rev']
+                tracker.dropped_attachments += 1
+            stream.write(encode(doc) + b'\n')
+            tracker.update(row['id'])
+    finally:
+        if stream is not fileobj:
+            # ends the gzip member, leaving `fileobj` open
+            stream.close()
+    tracker.finish()
+    return tracker
+
+
+def load(database, fileobj, compress='gzip', new_edits=False, batch_size=500,
+         concurrency=4, progress=None, interval=1.0):
+    """
+    Save every document in the NDJSON dump `fileobj` to `database`.
+    See `Database.load`.
+    """
+    tracker = Progress(progress, interval)
+    codec = database.codec
+    stream = _open(fileobj, 'rb', compress)
+    writer = database.bulk_writer(batch_size=batch_size, concurrency=concurrency,
+                                  new_edits=False)
+    # documents dumped without a revision can only be saved as new ones
+    fresh = database.bulk_writer(batch_size=batch_size, concurrency=concurrency)
+    try:
+        with writer, fresh:
+            for line in stream:
+                line = line.strip()
+                if not line:
+                    continue
+                doc = codec.decode(line)
+                if not new_edits and '_rev' in doc:
+                    # the dump already holds the JSON `_bulk_docs` needs
+                    writer.write_json(line)
+                else:
+                    doc.pop('_rev', None)
+                    fresh.write(doc)
+                    if not new_edits:
+                        tracker.new_revisions += 1
+                tracker.update()
+    finally:
+        if stream is not fileobj:
+            stream.close()
+    tracker.errors = writer.errors + fresh.errors
+    tracker.finish()
+    return tracker
+
+
+def last_id(path, compress='gzip'):
+    """
+    Return the ID of the last document in the dump at `path`, or None
+    if there isn't one, so that a dump can resume after it:
+
+        after = cloudant.backup.last_id('db.ndjson.gz')
+        with open('db.ndjson.gz', 'ab') as f:
+            db.dump(f, after=after)
+
+    A dump that was cut off leaves an incomplete line or gzip stream
+    behind, so the file is first rewritten to hold only its complete lines.
+    """
+    if not os.path.exists(path):
+        return None
+    count, last, complete = 0, None, True
+    with open(path, 'rb') as f:
+        stream = _open(f, 'rb', compress)
+        try:
+            for line in stream:
+                if not line.endswith(b'\n'):
+                    complete = False
+                    break
+                count, last = count + 1, line
+        except (EOFError, IOError, zlib.error):
+            complete = False
+    if not complete:
+        _truncate(path, count, compress)
+    return json.loads(last.decode('utf-8'))['_id'] if last else None
+
+
+def _truncate(path, count, compress):
+    """Rewrite the dump at `path` to hold only its first `count` lines."""
+    temp = path + '.tmp'
+    with open(path, 'rb') as source:
+        with open(temp, 'wb') as target:
+            reader = _open(source, 'rb', compress)
+            writer = _open(target, 'wb', compress)
+            for line in islice(reader, count):
+                writer.write(line)
+            if writer is not target:
+                writer.close()
+            target.flush()
+            os.fsync(target.fileno())
+    if os.name == 'nt':
+        # windows can't rename over an existing file
+        os.remove(path)
+    os.rename(temp, path)
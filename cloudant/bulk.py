@@ -0,0 +1,195 @@
+import threading
+from collections import deque
+from itertools import islice
+
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Marker(object):
+
+    """
+    Placeholder yielded in place of a document that couldn't be read,
+    such as `MISSING` or `DELETED`.
+    """
+
+    def __init__(self, name):
+        self.name = name
+
+    def __repr__(self):
+        return self.name
+
+MISSING = Marker('MISSING')
+DELETED = Marker('DELETED')
+
+
+def _chunks(iterable, size):
+    """Split `iterable` into lists of at most `size` items."""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _ordered_map(fn, iterable, concurrency):
+    """
+    Like `map`, but calls `fn` from a pool of `concurrency` threads,
+    keeping at most `concurrency` calls in flight and yielding
+    results in the order of `iterable`.
+    """
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+    pending = deque()
+    try:
+        for item in iterable:
+            pending.append(executor.submit(fn, item))
+            # yield finished results early, so a slow `iterable` doesn't hold them back
+            while pending and (len(pending) >= concurrency or pending[0].done()):
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=False)
+
+
+class BulkWriter(object):
+
+    """
+    Buffers documents and saves them through `_bulk_docs` in batches,
+    keeping up to `concurrency` requests in flight at once. Use it
+    through `Database.bulk_writer`, like this:
+
+        with db.bulk_writer(batch_size=500, concurrency=4) as writer:
+            writer.write({'_id': 'hello', ...})
+            writer.write_many(docs)
+        for result in writer.errors:
+            print result
+            # {'id': ..., 'error': 'conflict', 'reason': ...}
+
+    A batch is sent once it holds `batch_size` documents, or once adding
+    another document would push its JSON body past `max_bytes`.
+    When `concurrency` batches are already in flight, `write` blocks
+    until one of them returns, so memory use stays bounded.
+
+    If `new_edits` is false, documents are saved with the revisions in
+    their `_rev` fields, as replication does, rather than new ones.
+    """
+
+    def __init__(self, database, batch_size=500, max_bytes=None,
+                 concurrency=4, new_edits=True, **kwargs):
+        self.database = database
+        self.batch_size = batch_size
+        self.max_bytes = max_bytes
+        self.concurrency = concurrency
+        self.new_edits = new_edits
+        self.kwargs = kwargs
+
+        self._buffer = []
+        self._buffer_bytes = 0
+        self._batches = []
+        self._slots = threading.BoundedSemaphore(concurrency)
+        self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            # don't mask the original exception with a failed batch
+            self._shutdown()
+
+    def write(self, doc):
+        """
+        Add `doc` to the current batch,
+        sending the batch if it is full.
+        """
+        self.write_json(self.database.codec.encode(doc))
+
+    def write_json(self, encoded):
+        """
+        Like `write`, but for a document already encoded as JSON bytes,
+        which are sent as they are.
+        """
+        size = len(encoded) + 1  # the comma between documents
+        if self._buffer and self.max_bytes and \
+                self._buffer_bytes + size > self.max_bytes:
+            self.flush()
+        self._buffer.append(encoded)
+        self._buffer_bytes += size
+        if len(self._buffer) >= self.batch_size:
+            self.flush()
+
+    def write_many(self, docs):
+        """Add every document in the iterable `docs`."""
+        for doc in docs:
+            self.write(doc)
+
+    def flush(self):
+        """
+        Send the current batch, even if it isn't full.
+        Blocks while `concurrency` batches are already in flight.
+        """
+        if not self._buffer:
+            return
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.concurrency)
+        body = b''.join([b'{"docs":[', b','.join(self._buffer),
+                         b']}' if self.new_edits else b'],"new_edits":false}'])
+        self._buffer = []
+        self._buffer_bytes = 0
+
+        self._slots.acquire()
+        try:
+            future = self._executor.submit(self._send, body)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda future: self._slots.release())
+        self._batches.append(future)
+
+    def _send(self, body):
+        response = self.database.post('_bulk_docs', data=body, **self.kwargs)
+        # block until result if the object is using async/is a future
+        if hasattr(response, 'result'):
+            response = response.result()
+        response.raise_for_status()
+        return self.database.codec.decode(response.content)
+
+    def close(self):
+        """
+        Send any buffered documents and wait for every batch to finish.
+        Raises the first error encountered by a batch request.
+        """
+        try:
+            self.flush()
+            for future in self._batches:
+                future.result()
+        finally:
+            self._shutdown()
+
+    def _shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    @property
+    def results(self):
+        """
+        Per-document results from `_bulk_docs`, in the order the documents
+        were written, such as `{'id': ..., 'rev': ...}` for a saved document
+        or `{'id': ..., 'error': 'conflict', 'reason': ...}` for a rejected one.
+        Waits for any batches still in flight.
+        """
+        results = []
+        for future in self._batches:
+            results.extend(future.result())
+        return results
+
+    @property
+    def errors(self):
+        """The subset of `results` describing rejected documents."""
+        return [result for result in self.results if 'error' in result]
@@ -0,0 +1,259 @@
+import threading
+import time
+from collections import OrderedDict
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+from .codec import get_codec
+
+
+class CachedResponse(requests.Response):
+
+    """
+    A response served from a `DocumentCache` or `QueryCache`. `json()`
+    returns the body the cache already parsed with `codec`, which is
+    shared between reads, so copy it before changing it.
+    """
+
+    from_cache = True
+
+    def __init__(self, entry, url, codec=None):
+        super(CachedResponse, self).__init__()
+        self.codec = get_codec(codec)
+        self._entry = entry
+        self._content = entry.content
+        self.status_code = 200
+        self.reason = 'OK'
+        self.headers = CaseInsensitiveDict(entry.headers)
+        self.encoding = entry.encoding
+        self.url = url
+
+    def json(self, **kwargs):
+        if kwargs:
+            return super(CachedResponse, self).json(**kwargs)
+        if self._entry.doc is None:
+            self._entry.doc = self.codec.decode(self._content)
+        return self._entry.doc
+
+
+class _Entry(object):
+
+    def __init__(self, response):
+        self.content = response.content
+        self.headers = dict(response.headers)
+        self.encoding = response.encoding
+        self.etag = response.headers.get('ETag')
+        self.url = response.url
+        self.stored_at = time.time()
+        self.seq = None
+        self.doc = None
+
+
+class _LRUCache(object):
+
+    """
+    Responses kept in least recently used order, bounded by
+    `max_size` entries and, optionally, `max_bytes` of content.
+    """
+
+    def __init__(self, max_size, max_bytes=None):
+        self.max_size = max_size
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def stats(self):
+        """The cache's counters, as a dict."""
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'size': len(self._entries),
+            'bytes': self._bytes
+        }
+
+    def _lookup(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                # re-insert to mark as most recently used
+                self._entries[key] = entry
+            return entry
+
+    def _store(self, key, response):
+        entry = _Entry(response)
+        with self._lock:
+            self._discard(key)
+            self._entries[key] = entry
+            self._bytes += len(entry.content)
+            while len(self._entries) > self.max_size or \
+                    (self.max_bytes is not None and self._bytes > self.max_bytes):
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted.content)
+                self.evictions += 1
+        return entry
+
+    def _discard(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= len(entry.content)
+
+    def invalidate(self, key=None):
+        """Drop the entry for `key`, or every entry if None."""
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+                self._bytes = 0
+            else:
+                self._discard(key)
+
+
+class DocumentCache(_LRUCache):
+
+    """
+    A size-bounded LRU cache of document bodies, used by `Document.get`
+    once enabled with `Database.cache_documents`:
+
+        cache = db.cache_documents(max_size=1000)
+        config = db['config'].get().json()  # fetched from the server
+        config = db['config'].get().json()  # revalidated, 304 Not Modified
+        print cache.hits, cache.misses
+
+    Each read of a cached document sends its ETag as `If-None-Match`,
+    so an unchanged document costs a `304 Not Modified` with no body,
+    and its JSON isn't parsed again. If `ttl` is set, entries younger
+    than `ttl` seconds are served without asking the server at all.
+    Set `revalidate=False` to cache on TTL alone, refetching documents
+    in full once their entries expire.
+
+    Writes through a `Document` or `Database` invalidate the document's
+    entry, and so does every change read from `Database.changes`,
+    including through `ChangesFollower`, so following the database's
+    changes feed keeps the cache fresh.
+    """
+
+    def __init__(self, max_size=1000, ttl=None, revalidate=True, max_bytes=None):
+        if ttl is None and not revalidate:
+            raise ValueError("Caching without revalidation needs a `ttl`")
+        super(DocumentCache, self).__init__(max_size, max_bytes)
+        self.ttl = ttl
+        self.revalidate = revalidate
+        self.revalidations = 0
+
+    @property
+    def stats(self):
+        """The cache's counters, as a dict."""
+        return dict(super(DocumentCache, self).stats,
+                    revalidations=self.revalidations)
+
+    def get(self, document, **kwargs):
+        """
+        GET `document` through the cache. `kwargs` are passed to
+        the request whenever it goes to the server.
+        """
+        url = document.uri
+        entry = self._lookup(url)
+        if entry is not None:
+            fresh = self.ttl is not None and time.time() - entry.stored_at < self.ttl
+            if fresh:
+                self.hits += 1
+                return CachedResponse(entry, url, document.codec)
+            if self.revalidate and entry.etag:
+                headers = dict(document.opts.get('headers', {}),
+                               **kwargs.pop('headers', {}))
+                headers['If-None-Match'] = entry.etag
+                response = document._make_request('get', headers=headers, **kwargs)
+                if response.status_code == 304:
+                    entry.stored_at = time.time()
+                    self.hits += 1
+                    self.revalidations += 1
+                    return CachedResponse(entry, url, document.codec)
+                return self._miss(url, response)
+        response = document._make_request('get', **kwargs)
+        return self._miss(url, response)
+
+    def _miss(self, url, response):
+        self.misses += 1
+        if response.status_code == 200:
+            self._store(url, response)
+        else:
+            self.invalidate(url)
+        return response
+
+
+class QueryCache(_LRUCache):
+
+    """
+    A size-bounded LRU cache of index query results, used by `Index`
+    once enabled with `Database.cache_queries`:
+
+        cache = db.cache_queries(max_size=100, check_interval=5)
+        view = db.design('ddoc').view('by_date')
+        rows = view.get(params={'descending': True}).json()['rows']
+        rows = view.get(params={'descending': True}).json()['rows']  # cached
+        print cache.stats
+
+    Results are keyed by the index's URL and its query parameters,
+    after the same normalization `Resource` applies to every request.
+    Each entry is tagged with the database's `update_seq`, and served
+    without a round trip for as long as the sequence hasn't moved.
+    The sequence is checked with a `GET` of the database at most once
+    every `check_interval` seconds, so results can be stale for up to
+    that long. Memory is bounded to `max_size` entries and, optionally,
+    `max_bytes` of response bodies.
+    """
+
+    def __init__(self, max_size=100, check_interval=1.0, max_bytes=None):
+        super(QueryCache, self).__init__(max_size, max_bytes)
+        self.check_interval = check_interval
+        self.checks = 0
+        self._seqs = {}
+
+    @property
+    def stats(self):
+        """The cache's counters, as a dict."""
+        return dict(super(QueryCache, self).stats, checks=self.checks)
+
+    def _current_seq(self, index, database_url):
+        seq, checked_at = self._seqs.get(database_url, (None, 0))
+        if time.time() - checked_at < self.check_interval:
+            return seq
+        response = index._make_request('get', database_url)
+        response.raise_for_status()
+        seq = index.codec.decode(response.content)['update_seq']
+        self.checks += 1
+        self._seqs[database_url] = (seq, time.time())
+        return seq
+
+    def get(self, index, **kwargs):
+        """
+        Query `index` through the cache. `kwargs` are passed to
+        the request whenever it goes to the server.
+        """
+        opts = index._request_options('get', **kwargs)
+        params = opts.get('params') or {}
+        key = (index.uri, tuple(sorted(params.items())))
+        if index.database_uri is None:
+            raise ValueError("Can't cache queries of an index "
+                             "that wasn't created through a `Database`")
+        seq = self._current_seq(index, index.database_uri)
+        entry = self._lookup(key)
+        if entry is not None and entry.seq == seq:
+            self.hits += 1
+            return CachedResponse(entry, entry.url, index.codec)
+        self.misses += 1
+        response = index._make_request('get', **kwargs)
+        if response.status_code == 200:
+            self._store(key, response).seq = seq
+        else:
+            self.invalidate(key)
+        return response
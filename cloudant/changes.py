@@ -0,0 +1,337 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+
+import requests
+from concurrent.futures import ThreadPoolExecutor
+
+from .bulk import MISSING, DELETED
+
+
+class FileCheckpoint(object):
+
+    """
+    Stores a changes feed's `seq` in a local file as JSON.
+    Each save replaces the file atomically, so a crash mid-write
+    never leaves a corrupt checkpoint behind.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def load(self):
+        """Return the saved `seq`, or None if there isn't one."""
+        try:
+            with open(self.path) as f:
+                return json.load(f)['seq']
+        except (IOError, OSError):
+            return None
+
+    def save(self, seq):
+        """Save `seq`, replacing any previous checkpoint."""
+        temp = self.path + '.tmp'
+        with open(temp, 'w') as f:
+            json.dump({'seq': seq}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        if os.name == 'nt' and os.path.exists(self.path):
+            # windows can't rename over an existing file
+            os.remove(self.path)
+        os.rename(temp, self.path)
+
+
+class LocalDocumentCheckpoint(object):
+
+    """
+    Stores a changes feed's `seq` in the `_local/{name}` document of
+    `database`. Local documents aren't replicated and don't show up in
+    the changes feed, so saving a checkpoint never triggers a change.
+    """
+
+    def __init__(self, database, name):
+        self.document = database.document('/'.join(['_local', name]))
+        self._rev = None
+
+    def load(self):
+        """Return the saved `seq`, or None if there isn't one."""
+        response = self.document.get()
+        # block until result if the object is using async/is a future
+        if hasattr(response, 'result'):
+            response = response.result()
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+        doc = self.document.codec.decode(response.content)
+        self._rev = doc.get('_rev')
+        return doc.get('seq')
+
+    def save(self, seq):
+        """Save `seq`, replacing any previous checkpoint."""
+        response = self._put(seq)
+        if response.status_code == 409:
+            # the checkpoint was saved by another instance, or never
+            # loaded, so fetch its current revision and try again
+            self.load()
+            response = self._put(seq)
+        response.raise_for_status()
+        self._rev = self.document.codec.decode(response.content).get('rev')
+
+    def _put(self, seq):
+        doc = {'seq': seq}
+        if self._rev:
+            doc['_rev'] = self._rev
+        response = self.document.put(params=doc)
+        # block until result if the object is using async/is a future
+        if hasattr(response, 'result'):
+            response = response.result()
+        return response
+
+
+class ChangesFollower(object):
+
+    """
+    Follows a database's continuous changes feed, reconnecting whenever
+    the connection drops and resuming from the last change you processed.
+    For example:
+
+        store = cloudant.FileCheckpoint('changes.json')
+        follower = cloudant.ChangesFollower(db, store, include_docs=True)
+        for change in follower:
+            index(change['doc'])
+
+    A change counts as processed once you ask for the next one, so a
+    crash never loses a change: at worst, changes since the last
+    checkpoint are delivered again. Checkpoints are saved to `store`
+    every `checkpoint_every` changes or `checkpoint_interval` seconds,
+    whichever comes first, and when iteration stops.
+    `store` can be any object with `load()` and `save(seq)` methods,
+    such as `FileCheckpoint` or `LocalDocumentCheckpoint`.
+
+    After a failed connection, or a feed the server ends without any
+    changes, it waits `backoff` seconds before reconnecting, doubling the wait after each consecutive failure
+    up to `max_backoff`. If `emit_heartbeats` is true, it yields None
+    for each heartbeat, every `heartbeat` milliseconds while the feed
+    is idle. `params` are passed to `_changes`.
+    """
+
+    def __init__(self, database, store=None, since=None, checkpoint_every=100,
+                 checkpoint_interval=10, heartbeat=30000, backoff=1,
+                 max_backoff=60, emit_heartbeats=False, **params):
+        self.database = database
+        self.store = store
+        self.since = since
+        self.checkpoint_every = checkpoint_every
+        self.checkpoint_interval = checkpoint_interval
+        self.heartbeat = heartbeat
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.emit_heartbeats = emit_heartbeats
+        self.params = params
+
+        self.seq = None
+        self._saved_seq = None
+        self._saved_at = time.time()
+        self._unsaved = 0
+        self._stopped = False
+
+    def __iter__(self):
+        self.seq = self.since
+        if self.seq is None and self.store is not None:
+            self.seq = self.store.load()
+        self._saved_seq = self.seq
+        self._stopped = False
+        failures = 0
+        try:
+            while not self._stopped:
+                try:
+                    idle = True
+                    for change in self._feed():
+                        failures = 0
+                        if change is None:
+                            # heartbeats keep time-based checkpoints going
+                            self._maybe_checkpoint()
+                            if self.emit_heartbeats:
+                                yield None
+                                if self._stopped:
+                                    break
+                            continue
+                        idle = False
+                        yield change
+                        self.seq = change['seq']
+                        self._unsaved += 1
+                        self._maybe_checkpoint()
+                        if self._stopped:
+                            break
+                    if idle and not self._stopped:
+                        # the server ended the feed without a change, so
+                        # reconnecting at once would only spin
+                        time.sleep(self._delay(failures))
+                        failures += 1
+                except (requests.RequestException, ValueError) as e:
+                    # a dropped connection can also cut a line short
+                    response = getattr(e, 'response', None)
+                    if response is not None and response.status_code < 500:
+                        raise
+                    time.sleep(self._delay(failures))
+                    failures += 1
+        finally:
+            self.checkpoint()
+
+    def _delay(self, failures):
+        return min(self.backoff * 2 ** failures, self.max_backoff)
+
+    def _feed(self):
+        params = dict(self.params, feed='continuous', heartbeat=self.heartbeat)
+        if self.seq is not None:
+            params['since'] = self.seq
+        # a connection that misses several heartbeats is dead
+        timeout = self.heartbeat * 3 / 1000.0
+        return self.database.changes(params=params, emit_heartbeats=True,
+                                     timeout=timeout, on_last_seq=self._end)
+
+    def _end(self, last_seq):
+        # the feed ended, after a `limit` or `timeout`
+        self.seq = last_seq
+
+    def _maybe_checkpoint(self):
+        due = time.time() - self._saved_at >= self.checkpoint_interval
+        if self._unsaved >= self.checkpoint_every or (due and self._unsaved):
+            self.checkpoint()
+
+    def checkpoint(self):
+        """Save the `seq` of the last processed change to the store."""
+        self._saved_at = time.time()
+        self._unsaved = 0
+        if self.store is not None and self.seq != self._saved_seq:
+            self.store.save(self.seq)
+            self._saved_seq = self.seq
+
+    def stop(self):
+        """Stop following the feed once the current change is processed."""
+        self._stopped = True
+
+
+class ChangesProcessor(object):
+
+    """
+    Processes a database's changes in batches on a pool of workers,
+    like this:
+
+        def index(changes):
+            for change in changes:
+                print change['id'], change['doc']
+
+        store = cloudant.FileCheckpoint('indexer.json')
+        processor = cloudant.ChangesProcessor(db, index, store, workers=8)
+        processor.run()  # blocks until processor.stop() is called
+
+    Changes are grouped into batches of up to `batch_size`, and a batch
+    is sent off once it is full or once its first change has waited
+    `max_wait` seconds. If `include_docs` is true, each batch's documents
+    are fetched with one `Database.get_many` call and set as each
+    change's `doc`, which is None for deleted documents.
+
+    Batches are handed to `callback` on `workers` threads, or on
+    `executor` if given, such as a `ProcessPoolExecutor` for CPU-heavy
+    callbacks. At most `max_pending` batches are in flight at once.
+    The checkpoint in `store` only advances past a batch once it and
+    every batch before it have completed, so a crash replays at most
+    the batches that were in flight. If a callback raises, `run`
+    stops and raises the same error. `params` are passed to `_changes`.
+    """
+
+    def __init__(self, database, callback, store=None, batch_size=500,
+                 max_wait=1.0, workers=4, executor=None, max_pending=None,
+                 include_docs=True, checkpoint_interval=1.0, **params):
+        self.database = database
+        self.callback = callback
+        self.store = store
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.workers = workers
+        self.executor = executor
+        self.max_pending = max_pending or workers * 2
+        self.include_docs = include_docs
+        self.checkpoint_interval = checkpoint_interval
+        self.params = params
+
+        self.seq = None
+        self.batches = 0
+        self._follower = None
+        self._stopped = False
+
+    def run(self):
+        """Process changes until `stop` is called."""
+        self._stopped = False
+        since = self.store.load() if self.store is not None else None
+        self.seq = since
+        saved_seq = since
+        saved_at = time.time()
+        heartbeat = max(int(self.max_wait * 1000), 100)
+        self._follower = ChangesFollower(self.database, since=since,
+                                         heartbeat=heartbeat,
+                                         emit_heartbeats=True, **self.params)
+        pool = ThreadPoolExecutor(max_workers=self.workers)
+        slots = threading.BoundedSemaphore(self.max_pending)
+        pending = deque()  # (future, last seq of the batch), oldest first
+        batch = []
+        started = None
+
+        def submit():
+            slots.acquire()
+            future = pool.submit(self._process, batch)
+            future.add_done_callback(lambda future: slots.release())
+            pending.append((future, batch[-1]['seq']))
+
+        try:
+            for change in self._follower:
+                if change is not None:
+                    if not batch:
+                        started = time.time()
+                    batch.append(change)
+                if batch and (len(batch) >= self.batch_size or
+                              time.time() - started >= self.max_wait):
+                    submit()
+                    batch = []
+                # advance past every completed batch at the front
+                while pending and pending[0][0].done():
+                    future, seq = pending.popleft()
+                    future.result()
+                    self.seq = seq
+                    self.batches += 1
+                if self.store is not None and self.seq != saved_seq and \
+                        time.time() - saved_at >= self.checkpoint_interval:
+                    self.store.save(self.seq)
+                    saved_seq, saved_at = self.seq, time.time()
+                if self._stopped:
+                    break
+            if batch:
+                submit()
+            while pending:
+                future, seq = pending.popleft()
+                future.result()
+                self.seq = seq
+                self.batches += 1
+        finally:
+            pool.shutdown(wait=True)
+            if self.store is not None and self.seq != saved_seq:
+                self.store.save(self.seq)
+
+    def _process(self, batch):
+        if self.include_docs:
+            ids = [change['id'] for change in batch]
+            docs = dict(self.database.get_many(ids))
+            for change in batch:
+                doc = docs.get(change['id'])
+                change['doc'] = None if doc is MISSING or doc is DELETED else doc
+        if self.executor is not None:
+            return self.executor.submit(self.callback, batch).result()
+        return self.callback(batch)
+
+    def stop(self):
+        """Stop once the batches in flight complete."""
+        self._stopped = True
+        if self._follower is not None:
+            self._follower.stop()
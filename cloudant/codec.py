@@ -0,0 +1,85 @@
+import importlib
+import json
+
+try:
+    string_types = (basestring,)
+except NameError:
+    string_types = (str,)
+
+
+class Codec(object):
+
+    """
+    Encodes and decodes the JSON a `Resource` sends and streams, such as
+    request bodies, index rows and changes. Set one with the `codec`
+    option, on an `Account` or any other object, and the objects it
+    creates inherit it:
+
+        account = cloudant.Account('garbados', codec='orjson')
+        account = cloudant.Account('garbados', codec=('orjson', 'ujson'))
+        account = cloudant.Account('garbados', codec=cloudant.Codec(
+            dumps=rapidjson.dumps, loads=rapidjson.loads))
+
+    Names are imported with `get_codec`, which falls back on the
+    standard library's `json` if none of them are installed.
+
+    `dumps` may return bytes or text. If `binary` is true, `loads` must
+    accept UTF-8 bytes, and the row iterators pass it each row's bytes
+    straight from the response, instead of decoding them to text first.
+    """
+
+    def __init__(self, dumps=json.dumps, loads=json.loads, binary=False, name=None):
+        self._dumps = dumps
+        self.loads = loads
+        self.binary = binary
+        self.name = name or getattr(dumps, '__module__', None)
+
+    def __repr__(self):
+        return '<Codec %s>' % self.name
+
+    def dumps(self, obj):
+        """Encode `obj` as JSON text."""
+        data = self._dumps(obj)
+        # python 2's `json` returns `str`, which is already bytes
+        return data.decode('utf-8') if isinstance(data, bytes) and \
+            not isinstance(data, str) else data
+
+    def encode(self, obj):
+        """Encode `obj` as JSON, as UTF-8 bytes."""
+        data = self._dumps(obj)
+        return data if isinstance(data, bytes) else data.encode('utf-8')
+
+    def decode(self, data):
+        """Decode JSON from UTF-8 bytes."""
+        return self.loads(data if self.binary else data.decode('utf-8'))
+
+
+# the standard library's `json`; python 2's can't decode bytes beyond ASCII
+# any faster than text, so rows are decoded to text for its `raw_decode`
+json_codec = Codec(name='json')
+
+# libraries that decode bytes directly
+_BINARY = ('orjson', 'ujson', 'rapidjson', 'simplejson')
+
+
+def get_codec(codec=None):
+    """
+    Return the `Codec` for `codec`, which can be a `Codec`, None for the
+    standard library's `json`, the name of a module such as `'orjson'`,
+    or a tuple of names to try in order. Modules that aren't installed
+    are skipped, falling back on `json`.
+    """
+    if codec is None:
+        return json_codec
+    if isinstance(codec, Codec):
+        return codec
+    names = (codec,) if isinstance(codec, string_types) else codec
+    for name in names:
+        if name == 'json':
+            return json_codec
+        try:
+            module = importlib.import_module(name)
+        except ImportError:
+            continue
+        return Codec(module.dumps, module.loads, binary=name in _BINARY, name=name)
+    return json_codec
@@ -0,0 +1,95 @@
+import array
+from collections import OrderedDict
+
+try:
+    string_types = (basestring,)
+except NameError:
+    string_types = (str,)
+
+# typecodes whose columns can hold NaN for missing values
+FLOAT_TYPECODES = ('f', 'd')
+
+
+def _path(field):
+    """
+    Split a field like `'key.0'` or `'value.sum'` into the keys and
+    indexes that lead to it, as `('key', 0)` or `('value', 'sum')`.
+    """
+    if not isinstance(field, string_types):
+        return tuple(field)
+    return tuple(int(part) if part.isdigit() else part
+                 for part in field.split('.'))
+
+
+def _getter(path):
+    """Return a function that reads `path` from a row, or None if it's missing."""
+    if len(path) == 1:
+        key = path[0]
+
+        def get(row):
+            return row.get(key)
+        return get
+
+    def get(row):
+        value = row
+        try:
+            for key in path:
+                value = value[key]
+        except (KeyError, IndexError, TypeError):
+            return None
+        return value
+    return get
+
+
+def _appender(field, column, fill):
+    """
+    Return a function that appends a value to `column`, putting `fill`
+    in place of missing values and raising a `ValueError` that names
+    `field` if a value doesn't fit the column's type.
+    """
+    append = column.append
+
+    def add(value):
+        if value is None:
+            if fill is None:
+                raise ValueError('Row %d has no value for %r' % (len(column), field))
+            value = fill
+        try:
+            append(value)
+        except (TypeError, OverflowError) as e:
+            raise ValueError('Row %d has %r for %r: %s' % (len(column), value, field, e))
+    return add
+
+
+def to_columns(rows, fields, typecode='d', fill=None, numpy=False):
+    """
+    Read each of `fields` from every row in `rows` into its own column,
+    returning an `OrderedDict` that maps each field to its column.
+    See `Index.to_columns`.
+    """
+    if isinstance(fields, string_types):
+        fields = [fields]
+    columns = OrderedDict()
+    readers = []
+    for field in fields:
+        code = typecode.get(field, 'd') if isinstance(typecode, dict) else typecode
+        column = [] if code is None else array.array(code)
+        missing = fill
+        if missing is None and code in FLOAT_TYPECODES:
+            missing = float('nan')
+        columns[field] = column
+        readers.append((_getter(_path(field)), _appender(field, column, missing)))
+
+    for row in rows:
+        for get, add in readers:
+            add(get(row))
+
+    if numpy:
+        import numpy as np
+        for field, column in columns.items():
+            if isinstance(column, array.array):
+                # shares the array's memory rather than copying it
+                columns[field] = np.frombuffer(column, dtype=column.typecode)
+            else:
+                columns[field] = np.array(column)
+    return columns
@@ -0,0 +1,177 @@
+import threading
+import zlib
+
+from requests.exceptions import ContentDecodingError
+
+from .stream import JSONStream, wrap_errors
+
+
+class Transfer(object):
+
+    """
+    Byte counts for one request made with compression enabled, available
+    as `response.transfer`. `raw_sent` and `raw_received` count the
+    bodies as JSON, and `sent` and `received` as they went over the wire,
+    after compression. Counts for streamed bodies grow as they're read.
+    """
+
+    def __init__(self, compression):
+        self.compression = compression
+        self.sent = 0
+        self.raw_sent = 0
+        self.received = 0
+        self.raw_received = 0
+
+    def __repr__(self):
+        return '<Transfer sent=%d/%d received=%d/%d>' % (
+            self.sent, self.raw_sent, self.received, self.raw_received)
+
+    def _add(self, name, n):
+        setattr(self, name, getattr(self, name) + n)
+        self.compression._add(name, n)
+
+    def decode(self, chunks, response):
+        """
+        Decompress `chunks` of `response`'s body, as read from the wire,
+        counting their size before and after.
+        """
+        encoding = response.headers.get('Content-Encoding', '').lower()
+        # 32 + MAX_WBITS accepts both gzip and zlib headers
+        decoder = zlib.decompressobj(32 + zlib.MAX_WBITS) \
+            if encoding in ('gzip', 'deflate') else None
+        for chunk in chunks:
+            self._add('received', len(chunk))
+            if decoder is not None:
+                try:
+                    chunk = decoder.decompress(chunk)
+                except zlib.error as e:
+                    raise ContentDecodingError(e)
+            if chunk:
+                self._add('raw_received', len(chunk))
+                yield chunk
+        if decoder is not None:
+            chunk = decoder.flush()
+            if chunk:
+                self._add('raw_received', len(chunk))
+                yield chunk
+
+    def iter_content(self, response, chunk_size):
+        """Like `response.iter_content`, but counting what it reads."""
+        return self.decode(wrap_errors(response.raw.stream(chunk_size, decode_content=False)),
+                           response)
+
+
+class Compression(object):
+
+    """
+    Gzip compression for every request made through a session, enabled
+    with `Resource.enable_compression`:
+
+        account = cloudant.Account('garbados')
+        compression = account.enable_compression(min_size=1024)
+        db = account.database('db')
+        db.bulk_docs(*docs)
+        print compression.stats
+        # {'requests': 1, 'raw_sent': 81920, 'sent': 9314, ...}
+
+    Request bodies of at least `min_size` bytes are gzipped at `level`,
+    and so are bodies streamed from generators, whatever their size.
+    Responses are requested with `Accept-Encoding: gzip`, and the row
+    iterators, `Index.__iter__` and `Database.changes`, decompress them
+    as they arrive, rather than after reading the whole body.
+
+    Each response gets a `Transfer` with its own byte counts, as
+    `response.transfer`, and `stats` totals them for the session.
+    """
+
+    chunk_size = 65536
+
+    def __init__(self, min_size=1024, level=6):
+        self.min_size = min_size
+        self.level = level
+        self.requests = 0
+        self.sent = 0
+        self.raw_sent = 0
+        self.received = 0
+        self.raw_received = 0
+        self._lock = threading.Lock()
+
+    @property
+    def stats(self):
+        """The session's byte counters, as a dict."""
+        return {
+            'requests': self.requests,
+            'sent': self.sent,
+            'raw_sent': self.raw_sent,
+            'received': self.received,
+            'raw_received': self.raw_received
+        }
+
+    def _add(self, name, n):
+        # responses are read from many threads
+        with self._lock:
+            setattr(self, name, getattr(self, name) + n)
+
+    def _compressor(self):
+        # 16 + MAX_WBITS writes a gzip header, which python 2's zlib can't otherwise
+        return zlib.compressobj(self.level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def _gzip(self, chunks, transfer):
+        compressor = self._compressor()
+        for chunk in chunks:
+            transfer._add('raw_sent', len(chunk))
+            chunk = compressor.compress(chunk)
+            if chunk:
+                transfer._add('sent', len(chunk))
+                yield chunk
+        chunk = compressor.flush()
+        transfer._add('sent', len(chunk))
+        yield chunk
+
+    def prepare(self, opts):
+        """
+        Compress the body of the request described by `opts`, the keyword
+        arguments for Requests, and hook its response to count what it
+        reads. Returns the request's `Transfer`.
+        """
+        transfer = Transfer(self)
+        self._add('requests', 1)
+        headers = dict(opts.get('headers') or {})
+        headers.setdefault('Accept-Encoding', 'gzip')
+        data = opts.get('data')
+        if data is not None and 'Content-Encoding' not in headers:
+            if not isinstance(data, bytes) and hasattr(data, 'encode'):
+                data = data.encode('utf-8')
+            if isinstance(data, bytes):
+                if len(data) >= self.min_size:
+                    compressor = self._compressor()
+                    compressed = compressor.compress(data) + compressor.flush()
+                    transfer._add('raw_sent', len(data))
+                    transfer._add('sent', len(compressed))
+                    headers['Content-Encoding'] = 'gzip'
+                    data = compressed
+                else:
+                    transfer._add('raw_sent', len(data))
+                    transfer._add('sent', len(data))
+            elif isinstance(data, JSONStream):
+                headers['Content-Encoding'] = 'gzip'
+                data = self._gzip(data, transfer)
+            opts['data'] = data
+        opts['headers'] = headers
+
+        stream = opts.get('stream')
+        hooks = dict(opts.get('hooks') or {})
+        response_hooks = hooks.get('response', [])
+        if callable(response_hooks):
+            response_hooks = [response_hooks]
+
+        def hook(response, **kwargs):
+            response.transfer = transfer
+            if not stream:
+                # read the body now, counting it, instead of in Requests
+                response._content = b''.join(transfer.iter_content(response, self.chunk_size))
+                response._content_consumed = True
+            return response
+        hooks['response'] = [hook] + list(response_hooks)
+        opts['hooks'] = hooks
+        return transfer
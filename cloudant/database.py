@@ -1,8 +1,33 @@
-import json
 from .resource import Resource
-from .document import Document
+from .document import Document, _jittered
 from .design import Design
 from .index import Index
+from .stream import RowParser, iter_available, iter_content, iter_lines, parse_line
+from .changes import ChangesFollower
+from .cache import DocumentCache, QueryCache
+from .bulk import BulkWriter, MISSING, DELETED, _chunks, _ordered_map
+from .query import Query
+from . import backup
+
+
+def _revision(doc):
+    """Normalize a `bulk_get` request to `(id, rev, atts_since)`."""
+    if not isinstance(doc, (list, tuple)):
+        return doc, None, None
+    return tuple(doc) + (None,) * (3 - len(doc))
+
+
+def _lacks_bulk_get(response, codec):
+    """Whether `response` shows the server doesn't support `_bulk_get`."""
+    if response.status_code in (404, 405, 501):
+        return True
+    if response.status_code == 400:
+        # CouchDB 1.x takes `_bulk_get` for a document ID, and rejects it
+        try:
+            return codec.decode(response.content).get('error') == 'illegal_docid'
+        except ValueError:
+            return False
+    return False
 
 
 class Database(Resource):
@@ -13,12 +38,57 @@ class Database(Resource):
     Learn more about the raw API from the [Cloudant docs](http://docs.cloudant.com/api/database.html).
     """
 
+    doc_cache = None
+    query_cache = None
+    # whether the server has `_bulk_get`, once `bulk_get` has asked
+    _bulk_get_supported = None
+
     def document(self, name, **kwargs):
         """
         Create a `Document` object from `name`.
         """
         opts = dict(self.opts, **kwargs)
-        return Document(self._make_url(name), session=self._session, **opts)
+        document = Document(self._make_url(name), session=self._session, **opts)
+        document.doc_cache = self.doc_cache
+        return document
+
+    def cache_documents(self, max_size=1000, ttl=None, revalidate=True, max_bytes=None):
+        """
+        Cache the bodies of documents read through this object's
+        `Document` objects in a `DocumentCache`, and return the cache.
+        For example:
+
+            cache = db.cache_documents(max_size=100, ttl=5)
+            db['config'].get()  # served from the cache for 5 seconds
+
+        The cache only works with synchronous sessions.
+        """
+        if hasattr(self._session, 'executor'):
+            raise ValueError("Document caching needs a synchronous session")
+        self.doc_cache = DocumentCache(max_size=max_size, ttl=ttl,
+                                       revalidate=revalidate,
+                                       max_bytes=max_bytes)
+        return self.doc_cache
+
+    def cache_queries(self, max_size=100, check_interval=1.0, max_bytes=None):
+        """
+        Cache the results of queries made through this object's `Index`
+        objects, including those of its design documents, in a
+        `QueryCache`, and return the cache. For example:
+
+            cache = db.cache_queries(check_interval=5)
+            view = db.design('ddoc').view('by_date')
+            view.get(params={'limit': 10})
+            view.get(params={'limit': 10})  # cached until the database changes
+
+        The cache only works with synchronous sessions.
+        """
+        if hasattr(self._session, 'executor'):
+            raise ValueError("Query caching needs a synchronous session")
+        self.query_cache = QueryCache(max_size=max_size,
+                                      check_interval=check_interval,
+                                      max_bytes=max_bytes)
+        return self.query_cache
 
     def design(self, name, **kwargs):
         """
@@ -28,7 +98,10 @@ class Database(Resource):
             # refers to DB/_design/test
         """
         opts = dict(self.opts, **kwargs)
-        return Design(self._make_url('/'.join(['_design', name])), session=self._session, **opts)
+        design = Design(self._make_url('/'.join(['_design', name])), session=self._session, **opts)
+        design.query_cache = self.query_cache
+        design.database_uri = self.uri
+        return design
 
     def __getitem__(self, name):
         """Shortcut to `Database.document`."""
@@ -40,6 +113,8 @@ class Database(Resource):
         # block until result if the object is using async
         if hasattr(response, 'result'):
             response = response.result()
+        if self.doc_cache is not None:
+            self.doc_cache.invalidate(self._make_url(name))
         response.raise_for_status()
 
     def __delitem__(self, name):
@@ -48,14 +123,17 @@ class Database(Resource):
         For example:
 
             del db['docKey']
+
+        The document's current revision is read from the `ETag` of a
+        `HEAD` request, so its body is never downloaded.
         """
         doc = self.document(name)
-        response = doc.get()
+        response = doc.head()
         # block until result if the object is using async/is a future
         if hasattr(response, 'result'):
             response = response.result()
         response.raise_for_status()
-        rev = response.json()['_rev']
+        rev = response.headers['ETag'].strip('"')
         deletion = doc.delete(rev)
         # block until result if the object is using async/is a future
         if hasattr(deletion, 'result'):
@@ -70,12 +148,296 @@ class Database(Resource):
             for doc in db.all_docs():
                 print doc
         """
-        return Index(self._make_url('_all_docs'), session=self._session, **kwargs)
+        opts = dict(self.opts, **kwargs)
+        index = Index(self._make_url('_all_docs'), session=self._session, **opts)
+        index.query_cache = self.query_cache
+        index.database_uri = self.uri
+        return index
 
     def __iter__(self):
         """Formats `Database.all_docs` for use as an iterator."""
         return self.all_docs().__iter__()
 
+    def get_many(self, ids, include_docs=True, chunk_size=100, concurrency=4, **kwargs):
+        """
+        Fetch many documents by ID, `chunk_size` keys per request,
+        with up to `concurrency` requests to `_all_docs` in flight.
+        Yields `(id, doc)` pairs in the order of `ids`, like this:
+
+            for id, doc in db.get_many(ids):
+                if doc is cloudant.MISSING:
+                    # no such document
+                elif doc is cloudant.DELETED:
+                    # the document was deleted
+                else:
+                    print doc['_rev']
+
+        If `include_docs` is false, `doc` is the row's value,
+        such as `{'rev': ...}`, rather than the document itself.
+        """
+        params = dict(kwargs.pop('params', {}), include_docs=include_docs)
+        index = self.all_docs()
+
+        def fetch(keys):
+            response = index.post(params=dict(params),
+                                  data=self.codec.encode({'keys': keys}), **kwargs)
+            # block until result if the object is using async/is a future
+            if hasattr(response, 'result'):
+                response = response.result()
+            response.raise_for_status()
+            return self.codec.decode(response.content)['rows']
+
+        for rows in _ordered_map(fetch, _chunks(ids, chunk_size), concurrency):
+            for row in rows:
+                if 'error' in row:
+                    yield row['key'], MISSING
+                elif row['value'].get('deleted'):
+                    yield row['key'], DELETED
+                elif include_docs:
+                    yield row['key'], row['doc']
+                else:
+                    yield row['key'], row['value']
+
+    def bulk_get(self, docs, revs=True, attachments=False, chunk_size=100,
+                 concurrency=4, **kwargs):
+        """
+        Fetch specific revisions of many documents, given `(id, rev)` pairs,
+        including revisions that lost a conflict. A pair's `rev` can be
+        None, or the pair just an ID, for the winning revision. Yields
+        `(id, rev, doc)` in the order requested, like this:
+
+            for id, rev, doc in db.bulk_get([('a', '2-...'), ('a', '2-...')]):
+                if doc is cloudant.MISSING:
+                    # no such revision
+                else:
+                    print doc['_revisions']
+
+        Revisions are requested `chunk_size` at a time through `_bulk_get`,
+        with up to `concurrency` requests in flight, and each response is
+        parsed as it arrives. If `revs` is true, each document includes its
+        revision history; if `attachments` is, their contents too. A pair
+        can hold a third item, a list of revisions the caller already has,
+        so that only attachments added since are sent, as `atts_since`.
+        Servers without `_bulk_get` are asked with `open_revs` instead,
+        a request per document, `concurrency` at a time.
+        """
+        params = dict(kwargs.pop('params', {}), revs=revs, attachments=attachments)
+        pairs = (_revision(doc) for doc in docs)
+
+        def fetch(chunk):
+            if self._bulk_get_supported is not False:
+                query = []
+                for id, rev, atts_since in chunk:
+                    item = {'id': id}
+                    if rev:
+                        item['rev'] = rev
+                    if atts_since:
+                        item['atts_since'] = atts_since
+                    query.append(item)
+                response = self.post('_bulk_get', params=dict(params), stream=True,
+                                     data=self.codec.encode({'docs': query}), **kwargs)
+                # block until result if the object is using async/is a future
+                if hasattr(response, 'result'):
+                    response = response.result()
+                if not _lacks_bulk_get(response, self.codec):
+                    response.raise_for_status()
+                    self._bulk_get_supported = True
+                    return response
+                response.close()
+                self._bulk_get_supported = False
+            return [self._open_revs(id, rev, params, atts_since, **kwargs)
+                    for id, rev, atts_since in chunk]
+
+        for result in _ordered_map(fetch, _chunks(pairs, chunk_size), concurrency):
+            if isinstance(result, list):
+                for item in result:
+                    yield item
+                continue
+            try:
+                parser = RowParser('results', codec=self.codec)
+                for item in parser.parse(iter_content(result, 65536)):
+                    for doc in item['docs']:
+                        if 'ok' in doc:
+                            yield item['id'], doc['ok']['_rev'], doc['ok']
+                        else:
+                            yield item['id'], doc['error'].get('rev'), MISSING
+            finally:
+                result.close()
+
+    def _open_revs(self, id, rev, params, atts_since=None, **kwargs):
+        """Fetch a revision, or the winning one, without `_bulk_get`."""
+        document = self.document(id)
+        params = dict(params)
+        if rev:
+            params['open_revs'] = [rev]
+        if atts_since:
+            params['atts_since'] = atts_since
+        response = document.get(params=params, **kwargs)
+        # block until result if the object is using async/is a future
+        if hasattr(response, 'result'):
+            response = response.result()
+        if response.status_code == 404:
+            return id, rev, MISSING
+        response.raise_for_status()
+        result = self.codec.decode(response.content)
+        if not rev:
+            return id, result['_rev'], result
+        if 'ok' in result[0]:
+            return id, rev, result[0]['ok']
+        return id, rev, MISSING
+
+    def merge_many(self, changes, retries=3, backoff=0.1, batch_size=500, concurrency=4):
+        """
+        Merge many documents at once, given a dict of `{id: change}`, like
+        `Document.merge` does for one. Current revisions are fetched with
+        `Database.get_many`, each change is applied locally, and the
+        results are saved through `_bulk_docs`. Documents that don't exist
+        are created from their change. For example:
+
+            results = db.merge_many({'a': {'count': 1}, 'b': {'count': 2}})
+            print results['a']
+            # {'id': 'a', 'rev': '2-...', 'ok': True}
+
+        Documents that hit a conflict are fetched and merged again,
+        up to `retries` more times, waiting about `backoff` seconds before
+        the first retry and twice as long before each retry after that.
+        Returns each document's final `_bulk_docs` result, by ID.
+        """
+        results = {}
+        pending = dict(changes)
+        attempt = 0
+        while pending:
+            docs = []
+            for id, doc in self.get_many(list(pending), concurrency=concurrency):
+                if doc is MISSING or doc is DELETED:
+                    doc = {'_id': id}
+                else:
+                    doc = dict(doc)
+                doc.update(pending[id])
+                docs.append(doc)
+            with self.bulk_writer(batch_size=batch_size, concurrency=concurrency) as writer:
+                writer.write_many(docs)
+            conflicts = {}
+            for result in writer.results:
+                results[result['id']] = result
+                self._invalidate(result)
+                if result.get('error') == 'conflict' and attempt < retries:
+                    conflicts[result['id']] = pending[result['id']]
+            pending = conflicts
+            if pending:
+                _jittered(backoff, attempt)
+                attempt += 1
+        return results
+
+    def delete_many(self, ids, batch_size=500, concurrency=4):
+        """
+        Delete many documents, given either their IDs or a Mango selector
+        matching them. For example:
+
+            results = db.delete_many(['a', 'b'])
+            print results['a']
+            # {'id': 'a', 'rev': '2-...', 'ok': True}
+
+            db.delete_many({'type': 'session', 'expired': True})
+
+        Current revisions are looked up `batch_size` at a time, through
+        `_all_docs` for IDs or `_find` for a selector, without fetching
+        document bodies. Deletions are saved through `_bulk_docs` in
+        batches of `batch_size`, with up to `concurrency` requests in
+        flight. Returns each document's `_bulk_docs` result, by ID;
+        IDs that are missing or already deleted get a `not_found` error.
+        """
+        if isinstance(ids, dict):
+            revs = self._find_revs(ids, batch_size)
+        else:
+            revs = self.get_many(ids, include_docs=False, chunk_size=batch_size,
+                                 concurrency=concurrency)
+        results = {}
+        with self.bulk_writer(batch_size=batch_size, concurrency=concurrency) as writer:
+            for id, value in revs:
+                if value is MISSING or value is DELETED:
+                    reason = 'deleted' if value is DELETED else 'missing'
+                    results[id] = {'id': id, 'error': 'not_found', 'reason': reason}
+                else:
+                    writer.write({'_id': id, '_rev': value['rev'], '_deleted': True})
+        for result in writer.results:
+            results[result['id']] = result
+            self._invalidate(result)
+        return results
+
+    def _find_revs(self, selector, batch_size):
+        """Yield `(id, {'rev': rev})` for each document matching `selector`."""
+        query = Query(self, selector, fields=['_id', '_rev'], page_size=batch_size,
+                      allow_scan=True)
+        for doc in query:
+            yield doc['_id'], {'rev': doc['_rev']}
+
+    def find(self, selector, fields=None, sort=None, limit=None, page_size=100,
+             bookmark=None, allow_scan=False, **options):
+        """
+        Find the documents matching `selector` with Cloudant Query,
+        returning a `Query` that streams them a page at a time:
+
+            for doc in db.find({'type': 'user'}, fields=['_id', 'name'],
+                               sort=[{'name': 'asc'}], limit=1000):
+                print doc['name']
+
+        `fields` projects each document onto just those fields. Other
+        `options`, such as `use_index`, are sent with each request.
+        Unless `allow_scan` is true, a selector no index can answer
+        raises `cloudant.UnindexedQueryError`; see `Query` for more.
+
+        For more detail, see [the docs](https://docs.cloudant.com/cloudant_query.html#finding-documents-using-an-index).
+        """
+        return Query(self, selector, fields=fields, sort=sort, limit=limit,
+                     page_size=page_size, bookmark=bookmark,
+                     allow_scan=allow_scan, **options)
+
+    def explain(self, selector, **options):
+        """
+        Ask which index a query for `selector` would use, without running it.
+        `options` are the query's other fields, such as `sort`. For example:
+
+            plan = db.explain({'type': 'user'}).json()
+            print plan['index']['name']
+            # '_all_docs' means every document would be read
+        """
+        body = dict(options, selector=selector)
+        return self.post('_explain', data=self.codec.encode(body))
+
+    def create_index(self, fields, name=None, ddoc=None, index_type='json', **options):
+        """
+        Create a Cloudant Query index on `fields`, a list of field names,
+        or of `{field: 'asc'}` dicts for sorted indexes. For example:
+
+            db.create_index(['type', 'age'], name='type-age', ddoc='queries')
+
+        `options`, such as `partial_filter_selector`, are added to the
+        index definition. Creating an index that already exists is a no-op.
+        """
+        index = dict(options, fields=fields)
+        body = {'index': index, 'type': index_type}
+        if name is not None:
+            body['name'] = name
+        if ddoc is not None:
+            body['ddoc'] = ddoc
+        return self.post('_index', data=self.codec.encode(body))
+
+    def list_indexes(self, **kwargs):
+        """
+        List the database's Cloudant Query indexes. For example:
+
+            for index in db.list_indexes().json()['indexes']:
+                print index['ddoc'], index['name']
+        """
+        return self.get('_index', **kwargs)
+
+    def delete_index(self, ddoc, name, index_type='json', **kwargs):
+        """Delete the index `name` from the design document `ddoc`."""
+        if ddoc.startswith('_design/'):
+            ddoc = ddoc[len('_design/'):]
+        return self.delete('/'.join(['_index', ddoc, index_type, name]), **kwargs)
+
     def bulk_docs(self, *docs, **kwargs):
         """
         Save many docs, all at once. Each `doc` argument must be a dict, like this:
@@ -83,14 +445,96 @@ class Database(Resource):
                 db.bulk_docs({...}, {...}, {...})
                 # saves all documents in one HTTP request
 
+        To save more documents than fit in memory, pass a single
+        iterable or generator instead, and the request streams each
+        document as it's produced:
+
+                db.bulk_docs(doc for doc in read_docs())
+
         For more detail on bulk operations, see
         [Creating or updating multiple documents](http://docs.cloudant.com/api/database.html#creating-or-updating-multiple-documents)
         """
+        if len(docs) == 1 and not isinstance(docs[0], dict):
+            docs = docs[0]
+            if not isinstance(docs, (list, tuple)):
+                docs = iter(docs)
         params = {
             'docs': docs
         }
         return self.post('_bulk_docs', params=params, **kwargs)
 
+    def bulk_writer(self, batch_size=500, max_bytes=None, concurrency=4,
+                    new_edits=True, **kwargs):
+        """
+        Create a `BulkWriter` that saves documents through `_bulk_docs`
+        in batches of at most `batch_size` documents and `max_bytes` bytes,
+        with up to `concurrency` requests in flight. For example:
+
+            with db.bulk_writer(batch_size=1000) as writer:
+                writer.write_many(docs)
+            print writer.errors
+            # [{'id': ..., 'error': 'conflict', 'reason': ...}]
+
+        If `new_edits` is false, documents keep the revisions in their
+        `_rev` fields. `kwargs` are passed to each `_bulk_docs` request.
+        """
+        return BulkWriter(self, batch_size=batch_size, max_bytes=max_bytes,
+                          concurrency=concurrency, new_edits=new_edits, **kwargs)
+
+    def dump(self, fileobj, compress='gzip', include_attachments=False, after=None,
+             partitions=4, workers=None, progress=None, interval=1.0):
+        """
+        Write every document in the database to the binary file `fileobj`,
+        one JSON document per line, compressed with `compress`, which is
+        `'gzip'` or None. Returns a `cloudant.backup.Progress`. For example:
+
+            with open('backup.ndjson.gz', 'wb') as f:
+                print db.dump(f)
+                # <Progress 12000 docs, 3150.2 docs/s>
+
+        `_all_docs` is read as `partitions` ID ranges, up to `workers` at
+        once, with `Index.parallel_scan`. Documents are written in ID order
+        as they arrive, so memory use doesn't grow with the database.
+
+        Attachments are left out unless `include_attachments` is true, in
+        which case they're inlined as base64. Documents that lose their
+        attachments also lose their `_rev`, since it no longer describes
+        them, so `Database.load` saves them as new revisions; they're
+        counted in `Progress.dropped_attachments`. To resume a dump, append to
+        the file and pass the last ID it holds as `after`; see
+        `cloudant.backup.last_id`.
+
+        `progress` is called with the `Progress` at most once every
+        `interval` seconds, and once at the end.
+        """
+        return backup.dump(self, fileobj, compress=compress,
+                           include_attachments=include_attachments, after=after,
+                           partitions=partitions, workers=workers,
+                           progress=progress, interval=interval)
+
+    def load(self, fileobj, compress='gzip', new_edits=False, batch_size=500,
+             concurrency=4, progress=None, interval=1.0):
+        """
+        Save every document in the dump `fileobj`, as written by
+        `Database.dump`, through a `BulkWriter` with up to `concurrency`
+        batches in flight. Returns a `cloudant.backup.Progress`, whose
+        `errors` lists any documents that were rejected. For example:
+
+            with open('backup.ndjson.gz', 'rb') as f:
+                print db.load(f).errors
+                # []
+
+        Documents keep the revisions they were dumped with, so loading a
+        dump twice, or resuming an interrupted load, is harmless. Those
+        dumped without a revision, because their attachments were left out,
+        are saved as new revisions and counted in `Progress.new_revisions`;
+        loading them again reports them as conflicts.
+        If `new_edits` is true, every document is saved as a new revision.
+        """
+        return backup.load(self, fileobj, compress=compress, new_edits=new_edits,
+                           batch_size=batch_size, concurrency=concurrency,
+                           progress=progress, interval=interval)
+
     def changes(self, **kwargs):
         """
         Gets a list of the changes made to the database.
@@ -98,32 +542,72 @@ class Database(Resource):
         for post processing or synchronization.
 
         Automatically adjusts the request to handle the different response behavior
-        of polling, longpolling, and continuous modes.
+        of polling, longpolling, and continuous modes. Only changes are yielded;
+        once the feed ends, its `last_seq` is passed to `on_last_seq`, if given:
+
+            seqs = []
+            for change in db.changes(on_last_seq=seqs.append):
+                print change['id']
+            print seqs[0]
 
         For more information about the `_changes` feed, see
         [the docs](http://docs.cloudant.com/api/database.html#obtaining-a-list-of-changes).
         """
-        size = 512  # requests default chunk size value
+        continuous = False
         if 'params' in kwargs:
             if 'feed' in kwargs['params']:
                 if kwargs['params']['feed'] == 'continuous':
-                    kwargs['stream'] = True
-                    size = 1  # 1 byte because we don't want to hold the last
-                              # record in memory buffer in awaiting for new data
+                    continuous = True
         emit_heartbeats = kwargs.pop('emit_heartbeats', False)
+        on_last_seq = kwargs.pop('on_last_seq', None)
+        # read records as soon as they arrive, rather than waiting
+        # for a buffer to fill and holding the last record back
+        kwargs.setdefault('stream', True)
 
         response = self.get('_changes', **kwargs)
         response.raise_for_status()
 
-        for line in response.iter_lines(chunk_size=size):
+        if not continuous:
+            # normal and longpoll feeds are one JSON object,
+            # so parse its `results` as they arrive
+            parser = RowParser('results', codec=self.codec)
+            for change in parser.parse(iter_available(response)):
+                self._invalidate(change)
+                yield change
+            if on_last_seq is not None:
+                on_last_seq(parser.metadata.get('last_seq'))
+            return
+
+        for line in iter_lines(iter_available(response)):
             if not line:
                 if emit_heartbeats:
                     yield None
                 continue
-            line = line.decode('utf-8')
-            if line[-1] == ',':
-                line = line[:-1]
-            yield json.loads(line)
+            change = parse_line(line, self.codec)
+            if 'last_seq' in change and 'seq' not in change:
+                # a feed with a `limit` or `timeout` ends with its `last_seq`
+                if on_last_seq is not None:
+                    on_last_seq(change['last_seq'])
+                continue
+            self._invalidate(change)
+            yield change
+
+    def _invalidate(self, change):
+        """Drop a changed document from the document cache."""
+        if self.doc_cache is not None and 'id' in change:
+            self.doc_cache.invalidate(self._make_url(change['id']))
+
+    def follow(self, store=None, **kwargs):
+        """
+        Create a `ChangesFollower` that follows the continuous changes feed,
+        reconnecting when the connection drops and saving checkpoints
+        to `store`. For example:
+
+            store = cloudant.LocalDocumentCheckpoint(db, 'indexer')
+            for change in db.follow(store, include_docs=True):
+                print change['doc']
+        """
+        return ChangesFollower(self, store, **kwargs)
 
     def missing_revs(self, revs, **kwargs):
         """
@@ -1,5 +1,6 @@
 from .document import Document
 from .index import Index
+from .search import SearchIndex
 
 class Design(Document):
     """
@@ -8,6 +9,11 @@ class Design(Document):
     Learn more about design documents from the [Cloudant docs](http://docs.cloudant.com/api/design.html)
     """
 
+    # set by `Database.design` once `Database.cache_queries` is enabled
+    query_cache = None
+    # set by `Database.design`
+    database_uri = None
+
 
     def index(self, path, **kwargs):
         """
@@ -16,8 +22,14 @@ class Design(Document):
             index = doc.index('_view/index-name')
             # refers to /DB/_design/DOC/_view/index-name
         """
+        return self._index(Index, path, **kwargs)
+
+    def _index(self, cls, path, **kwargs):
         opts = dict(self.opts, **kwargs)
-        return Index(self._make_url(path), session=self._session, **opts)
+        index = cls(self._make_url(path), session=self._session, **opts)
+        index.query_cache = self.query_cache
+        index.database_uri = self.database_uri
+        return index
 
     def view(self, function, **kwargs):
         """
@@ -33,15 +45,17 @@ class Design(Document):
 
     def search(self, function, **kwargs):
         """
-        Creates a `Index` object referencing the search index at `_search/{function}`. For example:
+        Creates a `SearchIndex` object referencing the search index at `_search/{function}`. For example:
 
             index = doc.search('index-name')
             # refers to /DB/_design/DOC/_search/search-name
 
+        Iterating over it follows bookmarks through every matching row.
+
         For more details on search indexes, see
         [Searching for documents using Lucene queries](http://docs.cloudant.com/api/search.html#searching-for-documents-using-lucene-queries)
         """
-        return self.index('/'.join(['_search', function]), **kwargs)
+        return self._index(SearchIndex, '/'.join(['_search', function]), **kwargs)
 
     def list(self, function, index, **kwargs):
         """
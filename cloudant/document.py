@@ -1,5 +1,99 @@
+import json
+import mimetypes
+import os
+import random
+import time
+import uuid
+from collections import OrderedDict
+
+import requests
+from concurrent.futures import Future
+from requests.structures import CaseInsensitiveDict
+
 from .resource import Resource
-from .attachment import Attachment
+from .codec import json_codec
+from .attachment import Attachment, string_types
+from .stream import MultipartParser, ParseError
+
+
+def _jittered(backoff, attempt):
+    """Wait before retry number `attempt`, doubling `backoff` each time, +/-50%."""
+    time.sleep(backoff * 2 ** attempt * random.uniform(0.5, 1.5))
+
+
+class _MultipartBody(object):
+
+    """
+    A `multipart/related` request body holding a document and its
+    attachments, which are read from their sources `chunk_size` bytes
+    at a time as the body is sent. Its length is known up front,
+    so the request carries a `Content-Length`.
+    """
+
+    def __init__(self, boundary, doc, attachments, chunk_size, codec):
+        self.boundary = boundary
+        self.chunk_size = chunk_size
+        self.attachments = attachments
+        self._head = b''.join([
+            b'--', boundary, b'\r\n',
+            b'Content-Type: application/json\r\n\r\n',
+            codec.encode(doc), b'\r\n'])
+        self._length = len(self._head) + len(boundary) + 4
+        for name, (source, content_type, length) in attachments.items():
+            self._length += len(self._part_head(content_type)) + length + 2
+
+    def _part_head(self, content_type):
+        return b''.join([b'--', self.boundary, b'\r\n',
+                         b'Content-Type: ', content_type.encode('latin-1'),
+                         b'\r\n\r\n'])
+
+    def __len__(self):
+        return self._length
+
+    def __iter__(self):
+        yield self._head
+        for name, (source, content_type, length) in self.attachments.items():
+            yield self._part_head(content_type)
+            if isinstance(source, bytes):
+                yield source
+            else:
+                remaining = length
+                while remaining:
+                    chunk = source.read(min(self.chunk_size, remaining))
+                    if not chunk:
+                        raise IOError('Attachment %r ended %d bytes early' % (name, remaining))
+                    remaining -= len(chunk)
+                    yield chunk
+            yield b'\r\n'
+        yield b'--' + self.boundary + b'--'
+
+
+class MultipartResponse(requests.Response):
+
+    """
+    A document read with `Document.get(attachments=True)`. `json()` returns
+    the document with each attachment's `data` as raw bytes, rather than
+    base64, and `attachments` maps each attachment's name to its bytes.
+    """
+
+    def __init__(self, response, content, doc, attachments):
+        super(MultipartResponse, self).__init__()
+        self.status_code = response.status_code
+        self.reason = response.reason
+        self.headers = CaseInsensitiveDict(response.headers)
+        self.url = response.url
+        self.request = response.request
+        self.encoding = 'utf-8'
+        # the document part as sent, with its attachment stubs
+        self._content = content
+        self._content_consumed = True
+        self._doc = doc
+        self.attachments = attachments
+
+    def json(self, **kwargs):
+        if kwargs:
+            return super(MultipartResponse, self).json(**kwargs)
+        return self._doc
 
 
 class Document(Resource):
@@ -10,6 +104,98 @@ class Document(Resource):
     Learn more about the raw API from the [Cloudant docs](http://docs.cloudant.com/api/documents.html)
     """
 
+    # set by `Database.document` once `Database.cache_documents` is enabled
+    doc_cache = None
+
+    chunk_size = 65536
+
+    def get(self, path='', attachments=False, **kwargs):
+        """
+        Make a GET request against the document's URI joined with `path`.
+        If the database caches documents, plain GETs of the document
+        itself go through its `DocumentCache`.
+
+        If `attachments` is true, the document is fetched together with
+        its attachments as one `multipart/related` response, which is
+        parsed as it arrives, so attachments aren't base64-encoded.
+        Returns a `MultipartResponse`:
+
+            response = doc.get(attachments=True)
+            print response.attachments['photo.jpg'][:4]
+        """
+        if attachments:
+            return self._get_with_attachments(path, **kwargs)
+        if self.doc_cache is not None and not path and 'params' not in kwargs:
+            return self.doc_cache.get(self, **kwargs)
+        return super(Document, self).get(path, **kwargs)
+
+    def _get_with_attachments(self, path='', **kwargs):
+        headers = dict(self.opts.get('headers', {}), **kwargs.pop('headers', {}))
+        headers['Accept'] = 'multipart/related, application/json'
+        params = dict(kwargs.pop('params', {}), attachments='true')
+        response = super(Document, self).get(path, headers=headers, params=params,
+                                             stream=True, **kwargs)
+        # block until result if the object is using async/is a future
+        if hasattr(response, 'result'):
+            response = response.result()
+        content_type = response.headers.get('Content-Type', '')
+        if response.status_code != 200 or not content_type.startswith('multipart/'):
+            # errors, and servers that inline attachments as base64
+            return response
+        try:
+            boundary = self._boundary(content_type)
+            parts = MultipartParser(boundary).parse(
+                response.iter_content(self.chunk_size))
+            headers, content = next(parts)
+            # keep the stubs in order, to match parts without a filename;
+            # other codecs return dicts, which are ordered on python 3.7+
+            if self.codec is json_codec:
+                doc = json.loads(content.decode('utf-8'), object_pairs_hook=OrderedDict)
+            else:
+                doc = self.codec.decode(content)
+            stubs = doc.get('_attachments', {})
+            follows = [name for name, stub in stubs.items() if stub.get('follows')]
+            follows.reverse()
+            data = {}
+            for headers, body in parts:
+                name = self._part_name(headers)
+                if name not in stubs:
+                    # fall back on the order the stubs were listed in
+                    name = follows.pop() if follows else None
+                elif name in follows:
+                    follows.remove(name)
+                if name is None:
+                    raise ParseError('Unexpected attachment in multipart response')
+                data[name] = body
+                stub = dict(stubs[name], data=body)
+                stub.pop('follows', None)
+                stubs[name] = stub
+        except StopIteration:
+            raise ParseError('Multipart response had no document')
+        finally:
+            response.close()
+        return MultipartResponse(response, content, doc, data)
+
+    def _boundary(self, content_type):
+        for param in content_type.split(';')[1:]:
+            key, _, value = param.strip().partition('=')
+            if key.lower() == 'boundary':
+                return value.strip('"')
+        raise ParseError('No boundary in %r' % content_type)
+
+    def _part_name(self, headers):
+        for param in headers.get('content-disposition', '').split(';')[1:]:
+            key, _, value = param.strip().partition('=')
+            if key.lower() == 'filename':
+                return value.strip('"')
+        return None
+
+    def _make_request(self, method, path='', **kwargs):
+        response = super(Document, self)._make_request(method, path, **kwargs)
+        if self.doc_cache is not None and method not in ('get', 'head'):
+            self.doc_cache.invalidate(self.uri)
+        return response
+
     def attachment(self, name, **kwargs):
         """
         Create an `Attachment` object from `name` and the settings
@@ -18,11 +204,113 @@ class Document(Resource):
         opts = dict(self.opts, **kwargs)
         return Attachment(self._make_url(name), session=self._session, **opts)
 
-    def merge(self, change, **kwargs):
+    def put_with_attachments(self, doc, attachments, **kwargs):
+        """
+        Save `doc` together with `attachments`, a dict of names to sources,
+        in a single `multipart/related` request. Each source can be bytes,
+        a path, or a file object opened in binary mode, which is read from
+        its current position as the request is sent, so attachments are
+        never held in memory or base64-encoded. To set a content type,
+        pass a `(source, content_type)` tuple; otherwise it's guessed
+        from the name. For example:
+
+            doc.put_with_attachments({'title': 'Holiday'}, {
+                'photo.jpg': open('photo.jpg', 'rb'),
+                'notes.txt': (b'Sunny', 'text/plain')
+            })
+
+        Attachments the document already has are kept, as long as
+        `doc` includes their stubs. `kwargs` are passed to the request.
+        """
+        boundary = uuid.uuid4().hex.encode('ascii')
+        doc = dict(doc)
+        stubs = OrderedDict(doc.get('_attachments') or {})
+        parts = OrderedDict()
+        opened = []
+
+        def close(*args):
+            for f in opened:
+                f.close()
+
+        try:
+            for name, source in attachments.items():
+                content_type = None
+                if isinstance(source, tuple):
+                    source, content_type = source
+                if not content_type:
+                    content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+                if isinstance(source, string_types) and not isinstance(source, bytes) or \
+                        hasattr(source, '__fspath__'):
+                    source = open(source, 'rb')
+                    opened.append(source)
+                if isinstance(source, bytes):
+                    length = len(source)
+                else:
+                    length = self._remaining(source)
+                # the `follows` stubs have to be in the same order as the parts
+                stubs.pop(name, None)
+                stubs[name] = {'follows': True, 'content_type': content_type, 'length': length}
+                parts[name] = (source, content_type, length)
+            doc['_attachments'] = stubs
+
+            headers = dict(self.opts.get('headers', {}), **kwargs.pop('headers', {}))
+            headers['Content-Type'] = 'multipart/related; boundary="%s"' % boundary.decode('ascii')
+            data = _MultipartBody(boundary, doc, parts, self.chunk_size, self.codec)
+            response = self.put(data=data, headers=headers, **kwargs)
+        except Exception:
+            close()
+            raise
+        if hasattr(response, 'add_done_callback'):
+            # the upload is still running, so close the files once it's done
+            response.add_done_callback(close)
+        else:
+            close()
+        return response
+
+    def _remaining(self, f):
+        """The number of bytes between `f`'s position and its end."""
+        position = f.tell()
+        try:
+            return os.fstat(f.fileno()).st_size - position
+        except (AttributeError, IOError, OSError, ValueError):
+            # not a real file, such as BytesIO
+            end = f.seek(0, os.SEEK_END)
+            if end is None:
+                # python 2 file objects return nothing from seek
+                end = f.tell()
+            f.seek(position)
+            return end - position
+
+    def merge(self, change, retries=3, backoff=0.1, **kwargs):
         """
         Merge `change` into the document,
         and then `PUT` the updated document back to the server.
+        If the document doesn't exist yet, it's created from `change`.
+
+        If someone else updates the document between the `GET` and the
+        `PUT`, the `PUT` fails with `409 Conflict`, and the merge starts
+        over with a fresh copy of the document. It tries up to `retries`
+        more times, waiting about `backoff` seconds before the first retry
+        and twice as long before each retry after that.
         """
+        attempt = 0
+        while True:
+            response = self._merge(change, **kwargs)
+            is_future = hasattr(response, 'result')
+            # block until result if the object is using async/is a future
+            if is_future:
+                response = response.result()
+            if response.status_code != 409 or attempt >= retries:
+                break
+            _jittered(backoff, attempt)
+            attempt += 1
+        if is_future:
+            future = Future()
+            future.set_result(response)
+            return future
+        return response
+
+    def _merge(self, change, **kwargs):
         response = self.get()
         # block until result if the object is using async/is a future
         if hasattr(response, 'result'):
@@ -33,7 +321,8 @@ class Document(Resource):
             doc = {}
         else:
             response.raise_for_status()
-            doc = response.json()
+            # decode a copy, since cached documents are shared
+            doc = self.codec.decode(response.content)
 
         # merge!
         doc.update(change)
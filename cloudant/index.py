@@ -1,5 +1,8 @@
 from .resource import Resource
-import json
+from .stream import RowParser, iter_content
+from .pagination import Paginator
+from .scan import ParallelScan
+from .columns import to_columns
 
 
 class Index(Resource):
@@ -20,21 +23,63 @@ class Index(Resource):
     for how to do that.
     """
 
+    chunk_size = 8192
+    metadata = None
+    # set by `Database` and `Design` once `Database.cache_queries` is enabled
+    query_cache = None
+    # the URI of the database the index belongs to, set by `Database` and `Design`
+    database_uri = None
+
     def __iter__(self, **kwargs):
-        response = self.get(stream=True, **kwargs)
+        """
+        Stream the index's rows, parsing each one as soon as it arrives.
+        Raises `cloudant.stream.ParseError` if the response is malformed.
+
+        As the response is read, `Index.metadata` fills with the other
+        fields of the response, such as `total_rows` and `offset`.
+
+        If the index has a `QueryCache`, the whole response is read
+        through it instead of being streamed.
+        """
+        return self._stream('rows', **kwargs)
+
+    def _stream(self, array_key, **kwargs):
+        """Stream the elements of the response's `array_key` array."""
+        stream = self.query_cache is None
+        response = self.get(stream=stream, **kwargs)
         # block until result if the object is using async
         if hasattr(response, 'result'):
             response = response.result()
-        for line in response.iter_lines():
-            line = line.decode('utf-8')
-            if line:
-                if line[-1] == ',':
-                    line = line[:-1]
-                try:
-                    yield json.loads(line)
-                except (TypeError, ValueError):
-                    # if we can't decode a line, ignore it
-                    pass
+        response.raise_for_status()
+        parser = RowParser(array_key, codec=self.codec)
+        self.metadata = parser.metadata
+        for row in parser.parse(iter_content(response, self.chunk_size)):
+            yield row
+
+    def get(self, path='', **kwargs):
+        """
+        Make a GET request against the index's URI joined with `path`.
+        If the index has a `QueryCache`, plain queries of the index
+        itself go through it.
+        """
+        if self.query_cache is not None and not path and not kwargs.get('stream'):
+            return self.query_cache.get(self, **kwargs)
+        return super(Index, self).get(path, **kwargs)
+
+    @property
+    def total_rows(self):
+        """`total_rows` from the last response iterated over, if any."""
+        return (self.metadata or {}).get('total_rows')
+
+    @property
+    def offset(self):
+        """`offset` from the last response iterated over, if any."""
+        return (self.metadata or {}).get('offset')
+
+    @property
+    def update_seq(self):
+        """`update_seq` from the last response iterated over, if requested."""
+        return (self.metadata or {}).get('update_seq')
 
     def iter(self, **kwargs):
         """
@@ -51,3 +96,65 @@ class Index(Resource):
                 # with each row's emitting document
         """
         return self.__iter__(**kwargs)
+
+    def to_columns(self, fields, typecode='d', fill=None, numpy=False, **kwargs):
+        """
+        Stream the index's rows into one column per field, without
+        keeping the rows themselves, like so:
+
+            view = db.design('sales').view('by_month')
+            columns = view.to_columns(['key.0', 'key.1', 'value'],
+                                      params={'group_level': 2})
+            print sum(columns['value'])
+
+        Fields are dotted paths into each row, where numbers index arrays,
+        so `'key.1'` is the second component of an array key and
+        `'value.sum'` is the sum from a `_stats` reduce.
+
+        Each column is an `array.array` of `typecode`, which is `'d'` for
+        floats by default, or a dict mapping fields to typecodes. A typecode
+        of None collects a column, such as `'id'`, in a list instead.
+        Missing and null values become `fill`, which defaults to NaN in float
+        columns; otherwise they raise `ValueError`, as do values that
+        don't fit a column's type.
+
+        If `numpy` is true, the columns are returned as NumPy arrays,
+        which share the `array.array` buffers rather than copying them.
+        Other keyword arguments, like `params`, are passed to `Index.iter`.
+        """
+        return to_columns(self.iter(**kwargs), fields, typecode=typecode,
+                          fill=fill, numpy=numpy)
+
+    def paginate(self, page_size=100, cursor=None, **query):
+        """
+        Return a `Paginator` that iterates over the index `page_size` rows
+        at a time, starting each page from the last key of the previous one.
+        `query` holds the index's query parameters, like so:
+
+            pages = view.paginate(page_size=500, descending=True)
+            for row in pages:
+                # ...
+                save(pages.cursor)
+
+        Key parameters such as `startkey` and `endkey` are JSON-encoded for you.
+        Pass a saved `cursor` to resume from the page it marks.
+        """
+        return Paginator(self, page_size=page_size, cursor=cursor, **query)
+
+    def parallel_scan(self, partitions=4, workers=None, ordered=True, **query):
+        """
+        Return a `ParallelScan` that splits the index into `partitions` key
+        ranges and streams up to `workers` of them at once. For example:
+
+            for row in db.all_docs().parallel_scan(partitions=8, include_docs=True):
+                # rows arrive in key order
+
+            scan = view.parallel_scan(partitions=8, ordered=False)
+            for partition, row in scan:
+                # rows arrive as soon as any range produces them
+
+        `query` holds the index's query parameters.
+        Key parameters such as `startkey` and `endkey` are JSON-encoded for you.
+        """
+        return ParallelScan(self, partitions=partitions, workers=workers,
+                            ordered=ordered, **query)
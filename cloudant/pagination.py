@@ -0,0 +1,97 @@
+import time
+
+import requests
+
+
+# query parameters whose values are JSON, not plain strings
+KEY_PARAMS = ('key', 'startkey', 'endkey', 'start_key', 'end_key')
+
+
+class Paginator(object):
+
+    """
+    Walks an index one page at a time, using the last row of each page
+    as the `startkey` and `startkey_docid` of the next, so no request
+    ever has to `skip` rows. Use it through `Index.paginate`, like this:
+
+        pages = db.all_docs().paginate(page_size=1000, include_docs=True)
+        for row in pages:
+            print row['doc']
+
+    A page that fails to load is retried up to `retries` times,
+    waiting `backoff` seconds before the first retry and twice as
+    long before each retry after that.
+
+    `Paginator.cursor` is a JSON-serializable dict marking the next
+    page to read. It only advances once every row of a page has been
+    consumed, so you can save it and pass it as `cursor` to a later
+    `paginate` call to resume a job without skipping any rows:
+
+        pages = view.paginate(page_size=1000, cursor=saved_cursor)
+    """
+
+    def __init__(self, index, page_size=100, cursor=None, retries=3,
+                 backoff=0.5, **query):
+        for param in ('keys', 'skip'):
+            if param in query:
+                raise ValueError("Can't paginate with `%s`" % param)
+        self.index = index
+        self.page_size = page_size
+        self.retries = retries
+        self.backoff = backoff
+        self.limit = query.pop('limit', None)
+        self.query = query
+        self.cursor = cursor or {}
+        self.rows_read = 0
+
+    def __iter__(self):
+        for page in self.pages():
+            for row in page:
+                yield row
+
+    def pages(self):
+        """Yield each page of rows as a list."""
+        while not self.cursor.get('done'):
+            size = self.page_size
+            if self.limit is not None:
+                size = min(size, self.limit - self.rows_read)
+                if size <= 0:
+                    return
+            rows = self._fetch(size + 1)
+            page = rows[:size]
+            if page:
+                yield page
+            self.rows_read += len(page)
+            if len(rows) > size:
+                # the extra row is where the next page starts
+                self.cursor = {'startkey': rows[size]['key']}
+                if 'id' in rows[size]:
+                    self.cursor['startkey_docid'] = rows[size]['id']
+            else:
+                self.cursor = {'done': True}
+
+    def _params(self, limit):
+        params = dict(self.query, limit=limit)
+        params.update(self.cursor)
+        for param in KEY_PARAMS:
+            if param in params:
+                params[param] = self.index.codec.dumps(params[param])
+        return params
+
+    def _fetch(self, limit):
+        attempt = 0
+        while True:
+            try:
+                response = self.index.get(params=self._params(limit))
+                # block until result if the object is using async/is a future
+                if hasattr(response, 'result'):
+                    response = response.result()
+                response.raise_for_status()
+                return self.index.codec.decode(response.content)['rows']
+            except requests.RequestException as e:
+                response = getattr(e, 'response', None)
+                retryable = response is None or response.status_code >= 500
+                if not retryable or attempt >= self.retries:
+                    raise
+            time.sleep(self.backoff * 2 ** attempt)
+            attempt += 1
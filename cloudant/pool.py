@@ -0,0 +1,177 @@
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import urllib.parse as urlparse
+except ImportError:
+    import urlparse
+
+
+SETTINGS = ('pool_connections', 'pool_maxsize', 'pool_block',
+            'keep_alive', 'idle_timeout')
+
+
+class PooledAdapter(HTTPAdapter):
+
+    """
+    An `HTTPAdapter` shared by every session talking to one host.
+    Records when it was last used, so idle connections can be reaped.
+    """
+
+    def __init__(self, keep_alive=True, **kwargs):
+        self.keep_alive = keep_alive
+        self.last_used = time.time()
+        super(PooledAdapter, self).__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        self.last_used = time.time()
+        if not self.keep_alive:
+            request.headers['Connection'] = 'close'
+        return super(PooledAdapter, self).send(request, **kwargs)
+
+
+class ConnectionPools(object):
+
+    """
+    A registry of connection pools, one per host. Every `Resource`
+    created without a `session` gets its own `requests.Session`, so
+    cookies and auth stay separate, but its connections come from the
+    pool for its host, so objects for the same server reuse each
+    other's connections. Configure the shared registry with
+    `cloudant.configure_pools`:
+
+        cloudant.configure_pools(pool_maxsize=50, idle_timeout=30)
+
+    - `pool_maxsize`: connections kept open to each host.
+    - `pool_block`: if true, never open more than `pool_maxsize`
+      connections to a host; requests wait for a free one instead.
+    - `pool_connections`: urllib3 pools cached per host, one for each
+      distinct scheme, host and port.
+    - `keep_alive`: if false, close each connection after its request.
+    - `idle_timeout`: if set, a background thread closes the connections
+      of any host that hasn't been used for that many seconds.
+    """
+
+    def __init__(self, pool_connections=10, pool_maxsize=100, pool_block=False,
+                 keep_alive=True, idle_timeout=None):
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.pool_block = pool_block
+        self.keep_alive = keep_alive
+        self.idle_timeout = idle_timeout
+        self._adapters = {}
+        self._lock = threading.Lock()
+        self._reaper = None
+        self._stop_reaper = None
+        if idle_timeout:
+            self._start_reaper()
+
+    def configure(self, **settings):
+        """
+        Change the registry's settings. Existing pools are rebuilt with
+        the new settings, closing the connections they held.
+        """
+        for name, value in settings.items():
+            if name not in SETTINGS:
+                raise TypeError("Unknown pool setting `%s`" % name)
+            setattr(self, name, value)
+        with self._lock:
+            for adapter in self._adapters.values():
+                adapter.poolmanager.clear()
+                adapter.keep_alive = self.keep_alive
+                adapter.init_poolmanager(self.pool_connections,
+                                         self.pool_maxsize,
+                                         block=self.pool_block)
+        if self.idle_timeout:
+            self._start_reaper()
+        elif self._stop_reaper is not None:
+            self._stop_reaper.set()
+
+    def _key(self, uri):
+        parts = urlparse.urlparse(uri)
+        return '%s://%s' % (parts.scheme, parts.netloc.rpartition('@')[2])
+
+    def adapter(self, uri):
+        """Return the shared adapter for the host of `uri`."""
+        key = self._key(uri)
+        with self._lock:
+            adapter = self._adapters.get(key)
+            if adapter is None:
+                adapter = PooledAdapter(keep_alive=self.keep_alive,
+                                        pool_connections=self.pool_connections,
+                                        pool_maxsize=self.pool_maxsize,
+                                        pool_block=self.pool_block)
+                self._adapters[key] = adapter
+        return adapter
+
+    def session(self, uri):
+        """Create a `requests.Session` using the shared pool for `uri`'s host."""
+        return self.mount(requests.Session(), uri)
+
+    def mount(self, session, uri):
+        """
+        Make `session` use the shared pool for `uri`'s host, and return it.
+        """
+        adapter = self.adapter(uri)
+        session.mount(self._key(uri), adapter)
+        parts = urlparse.urlparse(uri)
+        if '@' in parts.netloc:
+            # requests keeps credentials in the URLs it sends,
+            # so the adapter has to be mounted under them too
+            session.mount('%s://%s' % (parts.scheme, parts.netloc), adapter)
+        return session
+
+    def reap(self, idle_timeout=None):
+        """
+        Close the pooled connections of every host unused for
+        `idle_timeout` seconds, defaulting to the registry's setting.
+        Returns how many hosts were reaped.
+        """
+        idle_timeout = idle_timeout if idle_timeout is not None else self.idle_timeout
+        if idle_timeout is None:
+            return 0
+        now = time.time()
+        with self._lock:
+            adapters = list(self._adapters.values())
+        reaped = 0
+        for adapter in adapters:
+            if now - adapter.last_used >= idle_timeout and len(adapter.poolmanager.pools):
+                adapter.poolmanager.clear()
+                reaped += 1
+        return reaped
+
+    def _start_reaper(self):
+        if self._reaper is not None and self._reaper.is_alive() \
+                and not self._stop_reaper.is_set():
+            return
+        self._stop_reaper = threading.Event()
+        self._reaper = threading.Thread(target=self._reap_forever,
+                                        args=(self._stop_reaper,))
+        self._reaper.daemon = True
+        self._reaper.start()
+
+    def _reap_forever(self, stop):
+        while True:
+            idle_timeout = self.idle_timeout
+            if not idle_timeout or stop.wait(max(idle_timeout / 2.0, 0.1)):
+                return
+            self.reap()
+
+    def close(self):
+        """Close every pooled connection and stop the idle reaper."""
+        if self._stop_reaper is not None:
+            self._stop_reaper.set()
+        with self._lock:
+            for adapter in self._adapters.values():
+                adapter.poolmanager.clear()
+
+
+pools = ConnectionPools()
+
+
+def configure_pools(**settings):
+    """Configure the shared `ConnectionPools` registry. See `ConnectionPools`."""
+    pools.configure(**settings)
@@ -0,0 +1,124 @@
+from concurrent.futures import ThreadPoolExecutor
+
+
+class UnindexedQueryError(ValueError):
+
+    """
+    Raised when a query would scan every document in the database,
+    because no index can answer its selector.
+    """
+
+    def __init__(self, message, query=None):
+        super(UnindexedQueryError, self).__init__(message)
+        self.query = query
+
+
+def _is_full_scan(warning):
+    # CouchDB and Cloudant word it differently, but both name the lack of an index
+    return bool(warning) and 'no matching index' in warning.lower()
+
+
+class Query(object):
+
+    """
+    Streams the documents matching a Cloudant Query selector, one page of
+    `page_size` documents at a time, following each page's `bookmark` to
+    the next. Use it through `Database.find`, like this:
+
+        query = db.find({'type': 'user', 'age': {'$gt': 21}},
+                        fields=['_id', 'name'], sort=[{'age': 'asc'}])
+        for doc in query:
+            print doc['name']
+
+    As soon as a page arrives, the next one is requested in the
+    background, so it's usually ready by the time the current page has
+    been consumed. `limit` caps the number of documents across pages.
+
+    Queries that no index can answer make the server read every document.
+    Unless `allow_scan` is true, the first page of such a query raises
+    `UnindexedQueryError`, so they're caught in development rather than
+    discovered in production. Check a selector ahead of time with
+    `Database.explain`.
+
+    `Query.bookmark` marks the next page to read. It only advances once
+    every document of a page has been consumed, so you can save it and
+    pass it as `bookmark` to a later `find` to resume without skipping
+    any documents.
+    """
+
+    def __init__(self, database, selector, fields=None, sort=None, limit=None,
+                 page_size=100, bookmark=None, allow_scan=False, **options):
+        self.database = database
+        self.selector = selector
+        self.fields = fields
+        self.sort = sort
+        self.limit = limit
+        self.page_size = page_size
+        self.bookmark = bookmark
+        self.allow_scan = allow_scan
+        self.options = options
+        self.docs_read = 0
+        self.warning = None
+
+    def __iter__(self):
+        for page in self.pages():
+            for doc in page:
+                yield doc
+
+    def _body(self, size, bookmark):
+        body = dict(self.options, selector=self.selector, limit=size)
+        if self.fields is not None:
+            body['fields'] = self.fields
+        if self.sort is not None:
+            body['sort'] = self.sort
+        if bookmark:
+            body['bookmark'] = bookmark
+        return body
+
+    def _page_size(self, read):
+        size = self.page_size
+        if self.limit is not None:
+            size = min(size, self.limit - read)
+        return size
+
+    def _fetch(self, size, bookmark):
+        response = self.database.post('_find', data=self.database.codec.encode(
+            self._body(size, bookmark)))
+        # block until result if the object is using async/is a future
+        if hasattr(response, 'result'):
+            response = response.result()
+        response.raise_for_status()
+        result = self.database.codec.decode(response.content)
+        if _is_full_scan(result.get('warning')) and not self.allow_scan:
+            raise UnindexedQueryError(
+                "No index matches selector %r; create one with "
+                "`Database.create_index`, or pass `allow_scan=True`" % (self.selector,),
+                query=self._body(size, bookmark))
+        return size, result
+
+    def pages(self):
+        """Yield each page of documents as a list."""
+        executor = ThreadPoolExecutor(max_workers=1)
+        try:
+            read = self.docs_read
+            size = self._page_size(read)
+            if size <= 0:
+                return
+            pending = executor.submit(self._fetch, size, self.bookmark)
+            while pending is not None:
+                size, result = pending.result()
+                docs = result['docs']
+                self.warning = result.get('warning')
+                read += len(docs)
+                # a short page is the last one
+                pending = None
+                next_size = self._page_size(read)
+                if len(docs) == size and next_size > 0:
+                    pending = executor.submit(self._fetch, next_size, result.get('bookmark'))
+                if docs:
+                    yield docs
+                self.docs_read = read
+                self.bookmark = result.get('bookmark')
+        finally:
+            # don't wait for a page nobody will read
+            executor.shutdown(wait=False)
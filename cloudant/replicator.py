@@ -0,0 +1,234 @@
+import threading
+import time
+
+from .bulk import MISSING, _ordered_map
+from .changes import ChangesFollower
+
+
+class Replicator(object):
+
+    """
+    Replicates one database into another from the client, so the two can
+    live on clusters that can't reach each other. For example:
+
+        source = cloudant.Account('https://a.example.com')['db']
+        target = cloudant.Account('https://b.example.com')['db']
+        store = cloudant.LocalDocumentCheckpoint(target, 'from-a')
+        replicator = cloudant.Replicator(source, target, store)
+        print replicator.run()
+        # {'changes_read': 1000, 'docs_written': 1000, 'docs_per_second': ...}
+
+    Replication runs as a pipeline of four stages, each working on
+    batches of up to `batch_size` changes:
+
+    1. read the source's changes feed, with every leaf revision;
+    2. ask the target which revisions it's missing, with `_revs_diff`,
+       on `diff_workers` threads;
+    3. fetch the missing revisions and their history from the source,
+       with `_bulk_get` or, for servers without it, `open_revs`,
+       on `fetch_workers` threads;
+    4. save them to the target through `_bulk_docs` with
+       `new_edits=false`, on `write_workers` threads.
+
+    Batches finish in the order they were read, so every `checkpoint_interval`
+    seconds the `seq` of the last finished batch is saved to `store`,
+    and the next run resumes from there. `store` can be any object with
+    `load()` and `save(seq)` methods, such as `LocalDocumentCheckpoint`.
+
+    If `continuous` is true, it follows the source's changes until
+    `stop` is called, sending a partial batch once its first change has
+    waited `max_wait` seconds. `report`, if given, is called with
+    `progress()` after each batch. `params` are passed to `_changes`,
+    so a `filter` can replicate a subset of documents.
+    """
+
+    def __init__(self, source, target, store=None, since=None, continuous=False,
+                 batch_size=100, diff_workers=2, fetch_workers=4, write_workers=2,
+                 max_wait=1.0, checkpoint_interval=5, create_target=False,
+                 report=None, **params):
+        self.source = source
+        self.target = target
+        self.store = store
+        self.since = since
+        self.continuous = continuous
+        self.batch_size = batch_size
+        self.diff_workers = diff_workers
+        self.fetch_workers = fetch_workers
+        self.write_workers = write_workers
+        self.max_wait = max_wait
+        self.checkpoint_interval = checkpoint_interval
+        self.create_target = create_target
+        self.report = report
+        self.params = params
+
+        self.seq = None
+        self.stats = {
+            'batches': 0,
+            'changes_read': 0,
+            'missing_revs': 0,
+            'docs_written': 0,
+            'doc_fetch_failures': 0,
+            'doc_write_failures': 0
+        }
+        self._last_seq = None
+        self._lock = threading.Lock()
+        self._started = None
+        self._follower = None
+        self._stopped = False
+
+    def _count(self, stat, n=1):
+        # stages update counters from their own threads
+        with self._lock:
+            self.stats[stat] += n
+
+    def _request(self, resource, method, path='', **kwargs):
+        response = getattr(resource, method)(path, **kwargs)
+        # block until result if the object is using async/is a future
+        if hasattr(response, 'result'):
+            response = response.result()
+        return response
+
+    def run(self):
+        """Replicate until the source's feed ends, or until `stop`. Returns `progress()`."""
+        self._stopped = False
+        self._started = time.time()
+        if self.create_target:
+            response = self._request(self.target, 'put')
+            if response.status_code != 412:
+                response.raise_for_status()
+        since = self.since
+        if since is None and self.store is not None:
+            since = self.store.load()
+        self.seq = since
+        saved_seq, saved_at = since, time.time()
+
+        batches = self._batches(self._changes(since))
+        diffs = _ordered_map(self._diff, batches, self.diff_workers)
+        fetched = _ordered_map(self._fetch, diffs, self.fetch_workers)
+        written = _ordered_map(self._write, fetched, self.write_workers)
+        try:
+            for seq in written:
+                if seq is None:
+                    continue
+                self.seq = seq
+                self.stats['batches'] += 1
+                if self.report is not None:
+                    self.report(self.progress())
+                if self.store is not None and self.seq != saved_seq and \
+                        time.time() - saved_at >= self.checkpoint_interval:
+                    self.store.save(self.seq)
+                    saved_seq, saved_at = self.seq, time.time()
+            if self._last_seq is not None and not self._stopped:
+                # the feed ended; everything up to its last_seq is replicated
+                self.seq = self._last_seq
+        finally:
+            for stage in (written, fetched, diffs, batches):
+                stage.close()
+            if self.store is not None and self.seq != saved_seq:
+                self.store.save(self.seq)
+        return self.progress()
+
+    def progress(self):
+        """Return the replication's counters, its `seq`, and its throughput so far."""
+        elapsed = time.time() - self._started if self._started else 0
+        progress = dict(self.stats, seq=self.seq, elapsed=elapsed)
+        progress['docs_per_second'] = self.stats['docs_written'] / elapsed if elapsed else 0
+        return progress
+
+    def stop(self):
+        """Stop once the batches in flight are saved."""
+        self._stopped = True
+        if self._follower is not None:
+            self._follower.stop()
+
+    def _changes(self, since):
+        params = dict(self.params, style='all_docs')
+        if self.continuous:
+            heartbeat = max(int(self.max_wait * 1000), 100)
+            self._follower = ChangesFollower(self.source, since=since,
+                                             heartbeat=heartbeat,
+                                             emit_heartbeats=True, **params)
+            return self._follower
+        if since is not None:
+            params['since'] = since
+        return self.source.changes(params=params, on_last_seq=self._end)
+
+    def _end(self, last_seq):
+        self._last_seq = last_seq
+
+    def _batches(self, changes):
+        """
+        Group changes into lists of up to `batch_size`. While a continuous
+        feed is idle, yield empty lists, which push the batches still
+        held by each stage's lookahead through the pipeline.
+        """
+        self._last_seq = None
+        batch, started = [], None
+        for change in changes:
+            if change is None:
+                if not batch:
+                    yield []
+            else:
+                if not batch:
+                    started = time.time()
+                batch.append(change)
+                self._count('changes_read')
+            if batch and (len(batch) >= self.batch_size or
+                          time.time() - started >= self.max_wait):
+                yield batch
+                batch = []
+            if self._stopped:
+                break
+        if batch:
+            yield batch
+
+    def _diff(self, batch):
+        """Find which of the batch's revisions the target is missing."""
+        revs = {}
+        for change in batch:
+            revs.setdefault(change['id'], []).extend(
+                rev['rev'] for rev in change['changes'])
+        if not revs:
+            return batch, {}
+        response = self._request(self.target, 'post', '_revs_diff',
+                                 data=self.target.codec.encode(revs))
+        response.raise_for_status()
+        diff = self.target.codec.decode(response.content)
+        self._count('missing_revs', sum(len(item['missing']) for item in diff.values()))
+        return batch, diff
+
+    def _fetch(self, item):
+        """Fetch each missing revision, with its history and attachments."""
+        batch, diff = item
+        if not diff:
+            return batch, []
+        revisions = [(id, rev, missing.get('possible_ancestors'))
+                     for id, missing in diff.items() for rev in missing['missing']]
+        docs = []
+        # batches are already fetched in parallel, so ask for each in one go
+        for id, rev, doc in self.source.bulk_get(revisions, attachments=True,
+                                                 chunk_size=len(revisions),
+                                                 concurrency=1,
+                                                 params={'latest': True}):
+            if doc is MISSING:
+                self._count('doc_fetch_failures')
+            else:
+                docs.append(doc)
+        return batch, docs
+
+    def _write(self, item):
+        """
+        Save the batch's revisions to the target as they are,
+        returning the `seq` of the batch's last change.
+        """
+        batch, docs = item
+        if docs:
+            body = self.target.codec.encode({'docs': docs, 'new_edits': False})
+            response = self._request(self.target, 'post', '_bulk_docs', data=body)
+            response.raise_for_status()
+            # with new_edits=false, only failures are listed
+            results = self.target.codec.decode(response.content)
+            failures = len([result for result in results if 'error' in result])
+            self._count('doc_write_failures', failures)
+            self._count('docs_written', len(docs) - failures)
+        return batch[-1]['seq'] if batch else None
@@ -1,8 +1,11 @@
-import json
 import copy
 
 import requests
 
+from .pool import pools
+from .compression import Compression
+from .codec import get_codec
+from .stream import JSONStream, is_streamable
 
 try:
     from requests_futures.sessions import FuturesSession
@@ -44,12 +47,12 @@ class Resource(object):
             if kwargs['async']:
                 if not requests_futures_available:
                     raise RequestsFutureNotAvailable()
-                self._session = FuturesSession()
+                self._session = pools.mount(FuturesSession(), uri)
             else:
-                self._session = requests.Session()
+                self._session = pools.session(uri)
             del kwargs['async']
         else:
-            self._session = requests.Session()
+            self._session = pools.session(uri)
 
         self._set_options(**kwargs)
 
@@ -61,9 +64,16 @@ class Resource(object):
                     'Accept': 'application/json'
                 }
             }
+        if 'codec' in kwargs:
+            kwargs['codec'] = get_codec(kwargs['codec'])
         if kwargs:
             self.opts.update(kwargs)
 
+    @property
+    def codec(self):
+        """The `Codec` set with the `codec` option, or the standard library's `json`."""
+        return self.opts.get('codec') or get_codec()
+
     def _make_url(self, path=''):
         """Joins the uri, and optional path"""
         if path:
@@ -81,15 +91,25 @@ class Resource(object):
         url = urlparse.urlunparse(parts)
         return url
 
-    def _make_request(self, method, path='', **kwargs):
+    def _request_options(self, method, **kwargs):
+        """
+        Merge `kwargs` into the object's options,
+        normalizing `params` according to `method`.
+        """
         # kwargs supercede self.opts
         opts = copy.copy(self.opts)
         opts.update(kwargs)
+        # the codec is ours, not an option for Requests
+        codec = get_codec(opts.pop('codec', None))
 
         # normalize `params` kwarg according to method
         if 'params' in opts:
             if method in ['post', 'put'] and 'data' not in opts:
-                opts['data'] = json.dumps(opts['params'])
+                if is_streamable(opts['params']):
+                    # encode generators lazily, as the body is sent
+                    opts['data'] = JSONStream(opts['params'], codec=codec)
+                else:
+                    opts['data'] = codec.encode(opts['params'])
                 del opts['params']
             else:
                 # cloudant breaks on True and False, so lowercase it
@@ -98,8 +118,28 @@ class Resource(object):
                     if value in [True, False]:
                         params[key] = str(value).lower()
                     elif type(value) in [list, dict, tuple]:
-                        params[key] = json.dumps(value)
+                        params[key] = codec.dumps(value)
                 opts['params'] = params
+        return opts
+
+    def enable_compression(self, min_size=1024, level=6):
+        """
+        Gzip request bodies of at least `min_size` bytes, and ask for
+        gzipped responses, for every request made through this object's
+        session, which it shares with the objects it creates.
+        Returns the session's `Compression`, which counts the bytes
+        saved; see `Compression` for more.
+        """
+        if not isinstance(self._session, requests.Session):
+            raise ValueError("Compression needs a Requests session")
+        self._session.compression = Compression(min_size=min_size, level=level)
+        return self._session.compression
+
+    def _make_request(self, method, path='', **kwargs):
+        opts = self._request_options(method, **kwargs)
+        compression = getattr(self._session, 'compression', None)
+        if compression is not None:
+            compression.prepare(opts)
 
         # make the request
         future = getattr(self._session, method)(self._make_url(path), **opts)
@@ -138,6 +178,12 @@ class Resource(object):
         `kwargs['params']` are turned into JSON before being
         passed to Requests. If you want to indicate the message
         body without it being modified, use `kwargs['data']`.
+
+        If `params` is a generator, or has one as a member, the body
+        is streamed as it's encoded, one element at a time:
+
+            keys = (line.strip() for line in open('keys.txt'))
+            view.post(params={'keys': keys})
         """
         return self._make_request('post', path, **kwargs)
 
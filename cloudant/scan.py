@@ -0,0 +1,235 @@
+import threading
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+from .bulk import _ordered_map
+from .pagination import KEY_PARAMS
+
+
+# candidate characters for `_all_docs` boundaries, in raw collation order
+ID_ALPHABET = ''.join(chr(i) for i in range(0x20, 0x7f))
+
+_DONE = object()
+
+# query parameters that bound the end of a range
+PROBE_EXCLUDED = ('endkey', 'end_key', 'endkey_docid', 'end_key_doc_id',
+                  'inclusive_end')
+
+
+class ParallelScan(object):
+
+    """
+    Reads an index as `partitions` contiguous key ranges, streaming up to
+    `workers` ranges at once over the index's session. Use it through
+    `Index.parallel_scan`, like this:
+
+        for row in db.all_docs().parallel_scan(partitions=8, workers=4):
+            # rows arrive in key order
+
+    Range boundaries for `_all_docs` come from the `offset` that CouchDB
+    reports for candidate ID prefixes, which is cheap to compute.
+    For views, boundaries are sampled keys found with `skip`.
+
+    If `ordered` is true, rows are yielded in key order: each range is
+    buffered in a queue of at most `buffer_size` rows, and ranges are
+    drained one after another. Otherwise, `(partition, row)` pairs are
+    yielded as soon as any range produces them.
+    """
+
+    def __init__(self, index, partitions=4, workers=None, ordered=True,
+                 buffer_size=1000, **query):
+        for param in ('keys', 'skip', 'limit', 'descending'):
+            if param in query:
+                raise ValueError("Can't scan in parallel with `%s`" % param)
+        self.index = index
+        self.partitions = partitions
+        self.workers = workers or partitions
+        self.ordered = ordered
+        self.buffer_size = buffer_size
+        self.query = query
+        self._ranges = None
+
+    def _params(self, **params):
+        """Merge `params` into the query, dropping any set to None."""
+        query = dict(self.query, **params)
+        for param, value in list(query.items()):
+            if value is None:
+                del query[param]
+            elif param in KEY_PARAMS:
+                query[param] = self.index.codec.dumps(value)
+        return query
+
+    def _get(self, probe=False, **params):
+        query = self._params(include_docs=False, **params)
+        if probe:
+            # a probe's startkey can fall past the query's end,
+            # which CouchDB rejects; offsets don't depend on the end anyway
+            for param in PROBE_EXCLUDED:
+                query.pop(param, None)
+        response = self.index.get(params=query)
+        # block until result if the object is using async/is a future
+        if hasattr(response, 'result'):
+            response = response.result()
+        response.raise_for_status()
+        return self.index.codec.decode(response.content)
+
+    def _offset(self, key, docid=None):
+        """Count the rows that sort before `key`."""
+        params = {'startkey': key, 'start_key': None, 'limit': 0,
+                  'startkey_docid': docid, 'start_key_doc_id': None}
+        response = self._get(probe=True, **params)
+        if 'offset' not in response:
+            raise ValueError("Can't partition an index without offsets; "
+                             "for reduce views, pass reduce=False")
+        return response['offset']
+
+    def _extent(self):
+        """Find the offsets of the first and last rows to scan."""
+        response = self._get(probe=True, limit=0)
+        if 'offset' not in response:
+            raise ValueError("Can't partition an index without offsets; "
+                             "for reduce views, pass reduce=False")
+        end = response['total_rows']
+        if 'endkey' in self.query:
+            end = self._offset(self.query['endkey'],
+                               self.query.get('endkey_docid'))
+        return response['offset'], end
+
+    def _id_boundary(self, target):
+        """
+        Find an ID prefix with about `target` rows before it,
+        extending the prefix one binary-searched character at a time.
+        """
+        prefix = ''
+        for depth in range(4):
+            low, high = 0, len(ID_ALPHABET) - 1
+            found = None
+            while low <= high:
+                middle = (low + high) // 2
+                offset = self._offset(prefix + ID_ALPHABET[middle])
+                if offset <= target:
+                    found = (ID_ALPHABET[middle], offset)
+                    low = middle + 1
+                else:
+                    high = middle - 1
+            if found is None:
+                break
+            prefix += found[0]
+            if found[1] == target:
+                break
+        return (prefix, None) if prefix else None
+
+    def _key_boundary(self, target, start):
+        """Find the key and doc ID of the row `target - start` rows in."""
+        params = {'limit': 1, 'skip': target - start}
+        rows = self._get(**params)['rows']
+        if not rows:
+            return None
+        return rows[0]['key'], rows[0].get('id')
+
+    def ranges(self):
+        """
+        Split the index into at most `partitions` ranges,
+        returning the query parameters for each.
+        """
+        if self._ranges is not None:
+            return self._ranges
+        start, end = self._extent()
+        count = end - start
+        targets = [start + count * i // self.partitions
+                   for i in range(1, self.partitions)]
+        if self.index.uri.endswith('_all_docs'):
+            find = self._id_boundary
+        else:
+            find = lambda target: self._key_boundary(target, start)
+        boundaries = []
+        for boundary in _ordered_map(find, targets, self.workers):
+            if boundary is None or boundary in boundaries:
+                continue
+            if find == self._id_boundary:
+                # a prefix can fall at or before the previous boundary
+                lowest = boundaries[-1][0] if boundaries \
+                    else self.query.get('startkey', '')
+                if boundary[0] <= lowest:
+                    continue
+            boundaries.append(boundary)
+
+        self._ranges = []
+        lower = {}
+        for key, docid in boundaries:
+            upper = {'endkey': key, 'endkey_docid': docid,
+                     'inclusive_end': False}
+            self._ranges.append(dict(lower, **upper))
+            lower = {'startkey': key, 'startkey_docid': docid}
+        self._ranges.append(lower)
+        return self._ranges
+
+    def __iter__(self):
+        ranges = self.ranges()
+        stop = threading.Event()
+        pending = queue.Queue()
+        for partition in range(len(ranges)):
+            pending.put(partition)
+        if self.ordered:
+            outputs = [queue.Queue(self.buffer_size) for _ in ranges]
+        else:
+            outputs = [queue.Queue(self.buffer_size)] * len(ranges)
+
+        def put(output, item):
+            while not stop.is_set():
+                try:
+                    output.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def work():
+            while not stop.is_set():
+                try:
+                    partition = pending.get_nowait()
+                except queue.Empty:
+                    return
+                output = outputs[partition]
+                try:
+                    index = self.index.__class__(self.index.uri,
+                                                 session=self.index._session,
+                                                 **self.index.opts)
+                    params = self._params(**ranges[partition])
+                    for row in index.iter(params=params):
+                        if not put(output, (partition, row, None)):
+                            return
+                    put(output, (partition, _DONE, None))
+                except Exception as e:
+                    put(output, (partition, _DONE, e))
+
+        threads = [threading.Thread(target=work)
+                   for _ in range(min(self.workers, len(ranges)))]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        try:
+            if self.ordered:
+                for output in outputs:
+                    while True:
+                        partition, row, error = output.get()
+                        if error is not None:
+                            raise error
+                        if row is _DONE:
+                            break
+                        yield row
+            else:
+                remaining = len(ranges)
+                while remaining:
+                    partition, row, error = outputs[0].get()
+                    if error is not None:
+                        raise error
+                    if row is _DONE:
+                        remaining -= 1
+                    else:
+                        yield partition, row
+        finally:
+            stop.set()
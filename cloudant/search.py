@@ -0,0 +1,75 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from .index import Index
+
+
+class SearchIndex(Index):
+
+    """
+    A Lucene search index. Iterating over it yields every matching row,
+    following each page's `bookmark` to the next, so large result sets
+    need no manual paging:
+
+        search = db.design('ddoc').search('by_name')
+        for row in search.iter(params={'q': 'name:luke*', 'include_docs': True}):
+            print row['doc']['name']
+
+    `limit` in `params` sets the page size, which defaults to `page_size`.
+    As soon as a page arrives, the next one is requested in the background,
+    so at most two pages are held in memory at once.
+
+    Facets requested with `counts` or `ranges` are returned once, with the
+    first page, in `SearchIndex.metadata`, alongside `total_rows`; later
+    pages don't ask for them again. With `group_field`, the search isn't
+    paged: the groups, each with its own `rows`, are streamed from a
+    single response instead.
+
+    `SearchIndex.bookmark` marks the next page to read, once every row of
+    a page has been consumed. Pass it back as the `bookmark` param to resume.
+    """
+
+    page_size = 200
+    bookmark = None
+
+    def __iter__(self, **kwargs):
+        params = dict(kwargs.pop('params', {}))
+        if 'group_field' in params:
+            return self._stream('groups', params=params, **kwargs)
+        return self._rows(params, **kwargs)
+
+    def _fetch(self, params, **kwargs):
+        response = self.get(params=dict(params), **kwargs)
+        # block until result if the object is using async
+        if hasattr(response, 'result'):
+            response = response.result()
+        response.raise_for_status()
+        return self.codec.decode(response.content)
+
+    def _rows(self, params, **kwargs):
+        size = int(params.setdefault('limit', self.page_size))
+        self.metadata = {}
+        executor = ThreadPoolExecutor(max_workers=1)
+        try:
+            pending = executor.submit(self._fetch, params, **kwargs)
+            first = True
+            while pending is not None:
+                page = pending.result()
+                rows = page.pop('rows', [])
+                bookmark = page.get('bookmark')
+                if first:
+                    self.metadata.update(page)
+                    # facets are the same on every page, so only ask once
+                    params.pop('counts', None)
+                    params.pop('ranges', None)
+                    first = False
+                pending = None
+                if len(rows) >= size and bookmark:
+                    params['bookmark'] = bookmark
+                    pending = executor.submit(self._fetch, dict(params), **kwargs)
+                for row in rows:
+                    yield row
+                self.bookmark = bookmark
+        finally:
+            # don't wait for a page nobody will read
+            executor.shutdown(wait=False)
+
@@ -0,0 +1,588 @@
+import codecs
+import json
+import re
+
+from requests.exceptions import ChunkedEncodingError, ConnectionError, ContentDecodingError
+from requests.packages.urllib3.exceptions import DecodeError, ProtocolError, ReadTimeoutError
+
+from .codec import get_codec, json_codec
+
+
+class ParseError(ValueError):
+
+    """Raised when a streamed response isn't the JSON we expected."""
+
+
+# outside of strings, only quotes and brackets change the nesting depth
+_STRUCTURE = re.compile(u'["{}\\[\\]]')
+# inside strings, only quotes and backslashes matter
+_STRING = re.compile(u'["\\\\]')
+# scalars end at the first delimiter
+_DELIMITER = re.compile(u'[\\s,\\]}]')
+_WHITESPACE = re.compile(u'\\s*')
+# the same, for parsing bytes
+_STRUCTURE_BYTES = re.compile(b'["{}\\[\\]]')
+_STRING_BYTES = re.compile(b'["\\\\]')
+_DELIMITER_BYTES = re.compile(b'[\\s,\\]}]')
+_WHITESPACE_BYTES = re.compile(b'\\s*')
+
+# parser states
+_START, _KEY, _COLON, _VALUE, _MEMBER, _ELEMENT, _ARRAY, _DONE = range(8)
+
+
+def iter_available(response, chunk_size=8192):
+    """
+    Yield the body of a streamed `response` as soon as each piece arrives,
+    at most `chunk_size` bytes at a time, without waiting to fill a buffer.
+    That way a feed that sends one record at a time never holds
+    the last record back while it waits for more data.
+    """
+    if getattr(response, '_content_consumed', False):
+        # the body was read when the request was made
+        if response.content:
+            yield response.content
+        return
+    transfer = getattr(response, 'transfer', None)
+    if transfer is not None:
+        # with compression enabled, decode here, counting both sizes
+        chunks = transfer.decode(_iter_raw(response, chunk_size, False), response)
+    else:
+        chunks = _iter_raw(response, chunk_size, True)
+    for chunk in chunks:
+        yield chunk
+
+
+def iter_content(response, chunk_size=8192):
+    """
+    Yield the body of a streamed `response`, `chunk_size` bytes at a time,
+    like `response.iter_content`, but letting its `Transfer`, if
+    compression is enabled, decompress and count it.
+    """
+    if getattr(response, '_content', False) is not False:
+        # the body was read when the request was made, or came from a cache
+        return iter([response.content])
+    transfer = getattr(response, 'transfer', None)
+    if transfer is not None:
+        return transfer.iter_content(response, chunk_size)
+    return response.iter_content(chunk_size)
+
+
+def wrap_errors(chunks):
+    """
+    Re-raise the urllib3 errors that reading `chunks` from a response's
+    `raw` body can raise as the Requests errors that `iter_content` would,
+    so that callers only need to catch `requests.RequestException`.
+    """
+    try:
+        for chunk in chunks:
+            yield chunk
+    except ProtocolError as e:
+        raise ChunkedEncodingError(e)
+    except DecodeError as e:
+        raise ContentDecodingError(e)
+    except ReadTimeoutError as e:
+        raise ConnectionError(e)
+
+
+def _iter_raw(response, chunk_size, decode_content):
+    return wrap_errors(_read_raw(response, chunk_size, decode_content))
+
+
+def _read_raw(response, chunk_size, decode_content):
+    raw = response.raw
+    if getattr(raw, 'chunked', False) and hasattr(raw, 'read_chunked') and \
+            raw.supports_chunked_reads():
+        # CouchDB sends each record as its own HTTP chunk
+        for chunk in raw.read_chunked(decode_content=decode_content):
+            if chunk:
+                yield chunk
+    elif hasattr(raw, 'read1'):
+        while True:
+            chunk = raw.read1(chunk_size, decode_content=decode_content)
+            if not chunk:
+                break
+            yield chunk
+    else:
+        # older urllib3 can only promise not to block with tiny reads
+        for chunk in raw.stream(1, decode_content=decode_content):
+            yield chunk
+
+
+def iter_lines(chunks):
+    """
+    Split `chunks` of bytes into newline-delimited records,
+    yielding empty records for blank lines such as heartbeats.
+    """
+    pending = b''
+    for chunk in chunks:
+        if pending:
+            chunk = pending + chunk
+        lines = chunk.split(b'\n')
+        pending = lines.pop()
+        for line in lines:
+            yield line.rstrip(b'\r')
+    if pending:
+        yield pending.rstrip(b'\r')
+
+
+def parse_line(line, codec=None):
+    """
+    Decode one record of a continuous feed from `line`, in bytes,
+    ignoring the trailing comma of a feed sent as an array.
+    """
+    codec = get_codec(codec)
+    if line[-1:] == b',':
+        line = line[:-1]
+    return codec.decode(line)
+
+
+def _is_iterator(value):
+    try:
+        return iter(value) is value
+    except TypeError:
+        return False
+
+
+def is_streamable(value):
+    """
+    Whether `value` is an iterator or generator, or a dict, list or tuple
+    with one as a member, so `JSONStream` should encode it instead of
+    `json.dumps`. Only that one level is checked, so it stays cheap
+    for a large list of documents.
+    """
+    if _is_iterator(value):
+        return True
+    if isinstance(value, dict):
+        return any(_is_iterator(item) for item in value.values())
+    if isinstance(value, (list, tuple)):
+        return any(_is_iterator(item) for item in value)
+    return False
+
+
+class JSONStream(object):
+
+    """
+    A request body that encodes `obj` as JSON while it's sent, so a huge
+    payload never exists in memory all at once. Iterators and generators
+    in `obj` are encoded as arrays, one element at a time, as they're
+    consumed, and the output is sent in chunks of about `chunk_size` bytes:
+
+        docs = ({'_id': str(i)} for i in range(1000000))
+        db.post('_bulk_docs', data=JSONStream({'docs': docs}))
+
+    Only iterators, and dicts, lists and tuples with an iterator as
+    a member, are walked; everything else, such as each document,
+    goes through one call to `codec`, a `Codec` defaulting to `json`.
+    Memory use is bounded by `chunk_size` plus the largest element.
+    Since its length is unknown, it's sent with chunked transfer encoding,
+    and it can only be sent once.
+    """
+
+    chunk_size = 65536
+
+    def __init__(self, obj, chunk_size=None, codec=None):
+        self.obj = obj
+        self.codec = get_codec(codec)
+        if chunk_size:
+            self.chunk_size = chunk_size
+
+    def __iter__(self):
+        pending, size = [], 0
+        for piece in self._encode(self.obj):
+            pending.append(piece)
+            size += len(piece)
+            if size >= self.chunk_size:
+                yield b''.join(pending)
+                pending, size = [], 0
+        if pending:
+            yield b''.join(pending)
+
+    def _encode(self, value):
+        encode = self.codec.encode
+        if _is_iterator(value):
+            items = value
+        elif isinstance(value, (list, tuple)) and is_streamable(value):
+            items = iter(value)
+        elif isinstance(value, dict) and is_streamable(value):
+            yield b'{'
+            for i, (key, item) in enumerate(value.items()):
+                yield (b', ' if i else b'') + encode(key) + b': '
+                for piece in self._encode(item):
+                    yield piece
+            yield b'}'
+            return
+        else:
+            yield encode(value)
+            return
+        yield b'['
+        for i, item in enumerate(items):
+            if i:
+                yield b', '
+            for piece in self._encode(item):
+                yield piece
+        yield b']'
+
+
+class RowParser(object):
+
+    """
+    Incrementally parses a JSON object such as
+
+        {"total_rows": 2, "offset": 0, "rows": [{...}, {...}]}
+
+    from chunks of bytes, yielding each element of the `array_key` array
+    as soon as it is complete. Every other top-level member is stored in
+    `metadata`. Memory use is bounded by the size of the largest row,
+    not of the whole response. For example:
+
+        parser = RowParser('rows')
+        for row in parser.parse(response.iter_content(8192)):
+            print row
+        print parser.metadata['total_rows']
+
+    Rows are decoded with `codec`, a `Codec` defaulting to `json`.
+    If the codec is binary, the parser works on the response's bytes,
+    handing each row to the codec without decoding it to text first.
+
+    Raises `ParseError` on malformed or truncated input.
+    """
+
+    def __init__(self, array_key='rows', codec=None):
+        self.array_key = array_key
+        self.metadata = {}
+        self.codec = get_codec(codec)
+        self._binary = self.codec.binary
+        if self._binary:
+            self._buffer = b''
+            self._text = None
+            self._structure, self._string = _STRUCTURE_BYTES, _STRING_BYTES
+            self._delimiter, self._whitespace = _DELIMITER_BYTES, _WHITESPACE_BYTES
+        else:
+            self._buffer = u''
+            self._text = codecs.getincrementaldecoder('utf-8')()
+            self._structure, self._string = _STRUCTURE, _STRING
+            self._delimiter, self._whitespace = _DELIMITER, _WHITESPACE
+        # only the standard library can find where a value ends as it decodes
+        self._json = json.JSONDecoder() if self.codec is json_codec else None
+        self._state = _START
+        self._key = None
+        self._first = True
+        # progress through the value being scanned, kept between chunks
+        # so that a row split across many chunks is only scanned once
+        self._scan = None
+
+    def parse(self, chunks):
+        """Parse every chunk in `chunks`, yielding rows as they complete."""
+        for chunk in chunks:
+            for row in self.feed(chunk):
+                yield row
+        for row in self.close():
+            yield row
+
+    def feed(self, chunk):
+        """Parse `chunk`, returning a list of the rows it completed."""
+        return self._parse(chunk, final=False)
+
+    def close(self):
+        """
+        Finish parsing, returning any remaining rows.
+        Raises `ParseError` if the input was incomplete.
+        """
+        rows = self._parse(b'', final=True)
+        if self._state != _DONE:
+            raise ParseError('Response ended before the JSON object was complete')
+        if self._buffer.strip():
+            raise ParseError('Unexpected data after the JSON object')
+        return rows
+
+    def _parse(self, chunk, final):
+        if self._binary:
+            text = chunk
+        else:
+            try:
+                text = self._text.decode(chunk, final)
+            except UnicodeDecodeError as e:
+                raise ParseError('Invalid UTF-8 in response: %s' % e)
+        if self._buffer:
+            self._buffer += text
+        else:
+            self._buffer = text
+        rows = []
+        pos = 0
+        while True:
+            step = self._step(pos, rows, final)
+            if step is None:
+                break
+            pos = step
+        self._buffer = self._buffer[pos:]
+        if self._scan is not None:
+            self._scan[0] -= pos
+            self._scan[1] -= pos
+        return rows
+
+    def _step(self, pos, rows, final):
+        """
+        Advance the parser by one token starting at `pos`.
+        Returns the new position, or None if more input is needed.
+        """
+        buf = self._buffer
+        pos = self._whitespace.match(buf, pos).end()
+        if pos >= len(buf):
+            return None
+        char = self._char(pos)
+        state = self._state
+
+        if state == _START:
+            self._expect(char, '{', pos)
+            self._state = _KEY
+            return pos + 1
+        elif state == _KEY:
+            if char == '}' and self._first:
+                self._state = _DONE
+                return pos + 1
+            self._expect(char, '"', pos)
+            value = self._read_value(pos, final)
+            if value is None:
+                return None
+            self._key, end = value
+            self._first = False
+            self._state = _COLON
+            return end
+        elif state == _COLON:
+            self._expect(char, ':', pos)
+            self._state = _VALUE
+            return pos + 1
+        elif state == _VALUE:
+            if self._key == self.array_key and char == '[':
+                self._state = _ELEMENT
+                self._first = True
+                return pos + 1
+            value = self._read_value(pos, final)
+            if value is None:
+                return None
+            self.metadata[self._key], end = value
+            self._state = _MEMBER
+            return end
+        elif state == _MEMBER:
+            if char == ',':
+                self._state = _KEY
+                return pos + 1
+            self._expect(char, '}', pos)
+            self._state = _DONE
+            return pos + 1
+        elif state == _ELEMENT:
+            if char == ']' and self._first:
+                self._state = _MEMBER
+                self._first = False
+                return pos + 1
+            value = self._read_value(pos, final)
+            if value is None:
+                return None
+            row, end = value
+            rows.append(row)
+            self._first = False
+            self._state = _ARRAY
+            return end
+        elif state == _ARRAY:
+            if char == ',':
+                self._state = _ELEMENT
+                return pos + 1
+            self._expect(char, ']', pos)
+            self._state = _MEMBER
+            return pos + 1
+        else:
+            raise ParseError('Unexpected data after the JSON object')
+
+    def _read_value(self, start, final):
+        """
+        Decode the JSON value starting at `start`.
+        Returns `(value, end)`, or None if the value isn't complete yet.
+        """
+        buf = self._buffer
+        if self._char(start) not in '{["':
+            # a scalar might continue in the next chunk, as in `12` + `34`
+            match = self._delimiter.search(buf, start)
+            if match:
+                end = match.start()
+            elif final:
+                end = len(buf)
+            else:
+                return None
+            return self._decode(buf[start:end]), end
+
+        if self._json is not None and (self._scan is None or self._scan[0] != start):
+            # fast path: let the C decoder find the end of the value
+            try:
+                return self._json.raw_decode(buf, start)
+            except ValueError:
+                if final:
+                    raise ParseError('Could not decode %r' % buf[start:start + 80])
+        elif self._json is None and self._scan is None:
+            # fast path: CouchDB sends each row on its own line,
+            # and a newline can't appear inside a JSON string
+            newline = buf.find(b'\n' if self._binary else u'\n', start)
+            if newline != -1:
+                data = buf[start:newline].rstrip()
+                if data[-1:] in (b',', u','):
+                    data = data[:-1].rstrip()
+                try:
+                    return self.codec.loads(data), start + len(data)
+                except ValueError:
+                    # more than one value on the line; find where this one ends
+                    pass
+        # either the value is incomplete or malformed, so find where it ends
+        end = self._scan_value(start)
+        if end is None:
+            return None
+        return self._decode(buf[start:end]), end
+
+    def _scan_value(self, start):
+        """
+        Find the end of the object, array or string starting at `start`,
+        resuming any scan from a previous chunk.
+        Returns None if the value isn't complete yet.
+        """
+        buf = self._buffer
+        if self._scan is not None and self._scan[0] == start:
+            _, pos, depth, in_string = self._scan
+        else:
+            pos, depth, in_string = start, 0, False
+        while True:
+            if in_string:
+                match = self._string.search(buf, pos)
+                if not match:
+                    pos = len(buf)
+                    break
+                pos = match.end()
+                if self._char(pos - 1) == '\\':
+                    if pos >= len(buf):
+                        # the escaped character hasn't arrived yet
+                        pos -= 1
+                        break
+                    pos += 1
+                    continue
+                in_string = False
+                if depth == 0:
+                    self._scan = None
+                    return pos
+            else:
+                match = self._structure.search(buf, pos)
+                if not match:
+                    pos = len(buf)
+                    break
+                pos = match.end()
+                token = self._char(pos - 1)
+                if token == '"':
+                    in_string = True
+                elif token in ('{', '['):
+                    depth += 1
+                else:
+                    depth -= 1
+                    if depth == 0:
+                        self._scan = None
+                        return pos
+        self._scan = [start, pos, depth, in_string]
+        return None
+
+    def _char(self, pos):
+        char = self._buffer[pos:pos + 1]
+        # compare bytes as text, since python 3 indexes bytes as ints
+        return char.decode('latin-1') if self._binary else char
+
+    def _decode(self, data):
+        try:
+            return self.codec.loads(data)
+        except ValueError as e:
+            raise ParseError('Could not decode %r: %s' % (data[:80], e))
+
+    def _expect(self, char, expected, pos):
+        if char != expected:
+            raise ParseError('Expected %r but found %r at offset %d' %
+                             (expected, char, pos))
+
+
+class MultipartParser(object):
+
+    """
+    Incrementally splits a `multipart/*` body delimited by `boundary`
+    into its parts, yielding `(headers, body)` for each part as soon as
+    it is complete. `headers` is a dict with lowercased names, and
+    `body` is bytes. For example:
+
+        parser = MultipartParser(boundary)
+        for headers, body in parser.parse(response.iter_content(65536)):
+            print headers['content-type'], len(body)
+    """
+
+    def __init__(self, boundary):
+        if not isinstance(boundary, bytes):
+            boundary = boundary.encode('ascii')
+        self.delimiter = b'\r\n--' + boundary
+        # the first delimiter needn't follow a line break
+        self._buffer = bytearray(b'\r\n')
+        self._searched = 0
+        self._headers = None
+        self._state = 'preamble'
+
+    def parse(self, chunks):
+        """Yield every part in `chunks`."""
+        for chunk in chunks:
+            for part in self.feed(chunk):
+                yield part
+        self.close()
+
+    def feed(self, chunk):
+        """Add `chunk` to the buffer, yielding any parts it completes."""
+        self._buffer.extend(chunk)
+        while True:
+            if self._state in ('preamble', 'body'):
+                # resume the search where the last one stopped
+                start = max(self._searched - len(self.delimiter) + 1, 0)
+                index = self._buffer.find(self.delimiter, start)
+                if index == -1:
+                    self._searched = len(self._buffer)
+                    return
+                # after the delimiter, `--` ends the body, and CRLF starts a part
+                end = index + len(self.delimiter)
+                if len(self._buffer) < end + 2:
+                    self._searched = index
+                    return
+                body = bytes(self._buffer[:index])
+                closing = self._buffer[end:end + 2] == b'--'
+                del self._buffer[:end + 2]
+                self._searched = 0
+                if self._state == 'body':
+                    yield self._headers, body
+                if closing:
+                    self._state = 'done'
+                    return
+                self._state = 'headers'
+            elif self._state == 'headers':
+                index = self._buffer.find(b'\r\n\r\n')
+                if self._buffer.startswith(b'\r\n'):
+                    # a part without headers
+                    index, skip = 0, 2
+                elif index == -1:
+                    return
+                else:
+                    skip = 4
+                self._headers = self._parse_headers(bytes(self._buffer[:index]))
+                del self._buffer[:index + skip]
+                self._state = 'body'
+            else:
+                # ignore the epilogue
+                del self._buffer[:]
+                return
+
+    def _parse_headers(self, data):
+        headers = {}
+        for line in data.decode('latin-1').split('\r\n'):
+            name, _, value = line.partition(':')
+            if name:
+                headers[name.strip().lower()] = value.strip()
+        return headers
+
+    def close(self):
+        """Raise `ParseError` if the body ended before its closing delimiter."""
+        if self._state != 'done':
+            raise ParseError('Multipart body ended early')
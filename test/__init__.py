@@ -1,11 +1,23 @@
 import cloudant
-from collections import defaultdict
+from collections import OrderedDict, defaultdict
 from types import GeneratorType
 import signal
 import time
+import gzip
+import io
 import json
+import math
+import os
+import requests
+import tempfile
+import threading
 import unittest
 
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+
 
 
 class ResourceTest(unittest.TestCase):
@@ -81,6 +93,155 @@ class AsyncTest(ResourceTest):
 
         del self.account[self.db_name]
 
+@unittest.skipUnless(hasattr(cloudant, 'AsyncAccount'), 'requires python 3.6+')
+class AsyncIOTest(ResourceTest):
+
+    def setUp(self):
+        super(AsyncIOTest, self).setUp()
+        import asyncio
+        self.loop = asyncio.new_event_loop()
+        self.account = cloudant.AsyncAccount(self.uri)
+        self.database = self.account.database(self.db_name)
+        self.document = self.database.document(self.doc_name)
+        self.wait(self.database.put()).raise_for_status()
+
+    def wait(self, coroutine):
+        return self.loop.run_until_complete(coroutine)
+
+    def collect(self, iterable):
+        # drive an async iterator without `async for`, which py2 can't parse
+        items = []
+        iterator = iterable.__aiter__()
+        while True:
+            try:
+                items.append(self.wait(iterator.__anext__()))
+            except StopAsyncIteration:
+                return items
+
+    def testDocument(self):
+        response = self.wait(self.document.put(params=self.test_doc))
+        response.raise_for_status()
+        response = self.wait(self.document.merge(self.test_otherdoc))
+        response.raise_for_status()
+        doc = self.wait(self.wait(self.document.get()).json())
+        assert doc['herp'] == 'derp' and doc['derp'] == 'herp'
+        response = self.wait(self.document.delete(doc['_rev']))
+        response.raise_for_status()
+        assert self.wait(self.document.get()).status_code == 404
+
+    def testConcurrent(self):
+        import asyncio
+        docs = [self.database.document('doc%d' % i) for i in range(50)]
+        tasks = [self.loop.create_task(doc.put(params={'i': i}))
+                 for i, doc in enumerate(docs)]
+        responses = self.wait(asyncio.gather(*tasks))
+        for response in responses:
+            response.raise_for_status()
+        rows = self.collect(self.database.all_docs())
+        assert len(rows) == 50
+
+    def testChanges(self):
+        response = self.wait(self.database.bulk_docs(self.test_doc, self.test_otherdoc))
+        response.raise_for_status()
+        seqs = []
+        changes = self.collect(self.database.changes(on_last_seq=seqs.append))
+        assert len(changes) == 2
+        assert all('id' in change for change in changes)
+        assert seqs[0] is not None
+        feed = self.database.changes(params={'feed': 'continuous', 'limit': 2})
+        changes = self.collect(feed)
+        assert len(changes) == 2 and all('seq' in change for change in changes)
+
+    def testCodec(self):
+        decoded = []
+
+        def loads(data):
+            decoded.append(data)
+            return json.loads(data)
+        database = self.account.database(self.db_name, codec=cloudant.Codec(loads=loads))
+        response = self.wait(database.get())
+        assert self.wait(response.json())['db_name'] == self.db_name
+        assert len(decoded) == 1
+
+    def testCredentials(self):
+        account = cloudant.AsyncAccount(self.uri.replace('//', '//user:p%40ss@'))
+        sent = []
+        write = account._session._write
+
+        def record(connection, method, parts, headers, data):
+            sent.append(headers)
+            return write(connection, method, parts, headers, data)
+        account._session._write = record
+        self.wait(account.get()).raise_for_status()
+        account.close()
+        assert sent[0]['Authorization'] == 'Basic dXNlcjpwQHNz'
+        assert sent[0]['Host'] == 'localhost:5984'
+
+    def tearDown(self):
+        self.wait(self.database.delete()).raise_for_status()
+        self.account.close()
+        self.loop.close()
+
+class PoolTest(ResourceTest):
+
+    def setUp(self):
+        super(PoolTest, self).setUp()
+        self.pools = cloudant.ConnectionPools(pool_maxsize=2)
+
+    def testShared(self):
+        db = cloudant.Database('/'.join([self.uri, self.db_name]))
+        otherdb = cloudant.Database('/'.join([self.uri, self.otherdb_name]))
+        adapter = db._session.get_adapter(db.uri)
+        assert adapter is otherdb._session.get_adapter(otherdb.uri)
+        assert adapter is cloudant.resource.pools.adapter(self.uri)
+        # sessions, and so cookies, stay separate
+        assert db._session is not otherdb._session
+        asyncdb = cloudant.Database('/'.join([self.uri, self.db_name]), async=True)
+        assert asyncdb._session.get_adapter(asyncdb.uri) is adapter
+
+    def testCredentials(self):
+        uri = 'http://user:pw@localhost:5984'
+        session = self.pools.session(uri + '/db')
+        adapter = self.pools.adapter(self.uri)
+        assert session.get_adapter(uri + '/db/doc') is adapter
+        assert session.get_adapter(self.uri + '/db/doc') is adapter
+        request = requests.Request('GET', uri + '/db/doc').prepare()
+        assert session.get_adapter(request.url) is adapter
+
+    def testConfigure(self):
+        session = self.pools.session(self.uri)
+        adapter = session.get_adapter(self.uri)
+        assert adapter.poolmanager.connection_pool_kw['maxsize'] == 2
+        self.pools.configure(pool_maxsize=20, pool_block=True)
+        assert adapter.poolmanager.connection_pool_kw['maxsize'] == 20
+        assert adapter.poolmanager.connection_pool_kw['block']
+        try:
+            self.pools.configure(herp='derp')
+        except TypeError:
+            pass
+        else:
+            assert False, 'should reject unknown settings'
+
+    def testReap(self):
+        session = self.pools.session(self.uri)
+        assert session.get(self.uri).status_code == 200
+        adapter = session.get_adapter(self.uri)
+        assert len(adapter.poolmanager.pools) == 1
+        assert self.pools.reap(idle_timeout=60) == 0
+        assert self.pools.reap(idle_timeout=0) == 1
+        assert len(adapter.poolmanager.pools) == 0
+        # the pool reopens on the next request
+        assert session.get(self.uri).status_code == 200
+
+    def testKeepAlive(self):
+        self.pools.configure(keep_alive=False)
+        session = self.pools.session(self.uri)
+        response = session.get(self.uri)
+        assert response.request.headers['Connection'] == 'close'
+
+    def tearDown(self):
+        self.pools.close()
+
 class AccountTest(ResourceTest):
 
     def setUp(self):
@@ -158,6 +319,111 @@ class DatabaseTest(ResourceTest):
         assert self.db.bulk_docs(
             self.test_doc, self.test_otherdoc).status_code == 201
 
+    def testBulkWriter(self):
+        docs = [{'_id': 'doc%d' % i, 'i': i} for i in range(25)]
+        with self.db.bulk_writer(batch_size=10, concurrency=2) as writer:
+            writer.write(docs[0])
+            writer.write_many(docs[1:])
+        results = writer.results
+        assert [result['id'] for result in results] == [doc['_id'] for doc in docs]
+        assert not writer.errors
+
+        # writing the same ids again conflicts
+        with self.db.bulk_writer(max_bytes=64) as writer:
+            writer.write_many(docs[:3])
+        assert len(writer.errors) == 3
+        assert writer.errors[0]['error'] == 'conflict'
+
+    def testGetMany(self):
+        self.db['a'] = self.test_doc
+        self.db['b'] = self.test_otherdoc
+        self.db['c'] = self.test_doc
+        del self.db['c']
+
+        ids = ['b', 'missing', 'a', 'c']
+        results = list(self.db.get_many(ids, chunk_size=2, concurrency=2))
+        assert [id for id, doc in results] == ids
+        assert results[0][1]['name'] == self.test_otherdoc['name']
+        assert results[1][1] is cloudant.MISSING
+        assert results[2][1]['name'] == self.test_doc['name']
+        assert results[3][1] is cloudant.DELETED
+
+        results = dict(self.db.get_many(['a'], include_docs=False))
+        assert 'rev' in results['a']
+
+    def testMergeMany(self):
+        self.db['a'] = self.test_doc
+        self.db['b'] = self.test_otherdoc
+        self.db['c'] = self.test_doc
+        del self.db['c']
+
+        def merge(n):
+            changes = dict((id, {'n%d' % n: n}) for id in ['a', 'b', 'c', 'd'])
+            results.append(self.db.merge_many(changes, backoff=0.01))
+        results = []
+        threads = [threading.Thread(target=merge, args=(n,)) for n in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for result in results:
+            assert sorted(result) == ['a', 'b', 'c', 'd']
+            assert all(row.get('ok') for row in result.values())
+        docs = dict(self.db.get_many(['a', 'b', 'c', 'd']))
+        for doc in docs.values():
+            assert [doc['n%d' % n] for n in range(3)] == [0, 1, 2]
+        assert docs['a']['name'] == self.test_doc['name']
+        assert 'name' not in docs['c']
+
+    def testDeleteMany(self):
+        docs = [{'_id': 'doc%02d' % i, 'even': i % 2 == 0} for i in range(20)]
+        with self.db.bulk_writer() as writer:
+            writer.write_many(docs)
+        self.db['gone'] = self.test_doc
+        del self.db['gone']
+
+        results = self.db.delete_many(['doc00', 'doc01', 'missing', 'gone'],
+                                      batch_size=3)
+        assert results['doc00']['ok'] and results['doc01']['ok']
+        assert results['missing'] == {'id': 'missing', 'error': 'not_found',
+                                      'reason': 'missing'}
+        assert results['gone']['reason'] == 'deleted'
+
+        results = self.db.delete_many({'even': True}, batch_size=3)
+        assert len(results) == 9
+        assert all(result['ok'] for result in results.values())
+        remaining = [id for id, doc in self.db.get_many(['doc%02d' % i for i in range(20)])
+                     if doc is not cloudant.DELETED]
+        assert remaining == ['doc%02d' % i for i in range(3, 20, 2)]
+
+    def testReplicator(self):
+        docs = [{'_id': 'doc%02d' % i, 'i': i} for i in range(25)]
+        with self.db.bulk_writer() as writer:
+            writer.write_many(docs)
+        self.db.document('doc00').merge({'i': 100})
+        del self.db['doc01']
+        target = cloudant.Database('/'.join([self.uri, self.otherdb_name]))
+        store = cloudant.LocalDocumentCheckpoint(target, 'replicator')
+        reports = []
+        replicator = cloudant.Replicator(self.db, target, store, batch_size=10,
+                                         create_target=True, report=reports.append)
+        progress = replicator.run()
+        assert progress['changes_read'] == 25
+        assert progress['docs_written'] == 25
+        assert len(reports) == 3
+        source = dict(self.db.get_many(['doc%02d' % i for i in range(25)]))
+        copied = dict(target.get_many(['doc%02d' % i for i in range(25)]))
+        assert copied == source
+        assert copied['doc00']['i'] == 100 and copied['doc01'] is cloudant.DELETED
+
+        # resumes from the checkpoint
+        self.db['new'] = self.test_doc
+        progress = cloudant.Replicator(self.db, target, store).run()
+        assert progress['changes_read'] == 1 and progress['docs_written'] == 1
+        assert target.document('new').get().json()['_rev'] == \
+            self.db.document('new').get().json()['_rev']
+        assert target.delete().status_code == 200
+
     def testIter(self):
         assert self.db.bulk_docs(
             self.test_doc, self.test_otherdoc).status_code == 201
@@ -172,9 +438,218 @@ class DatabaseTest(ResourceTest):
         resp = self.db.all_docs().get(params={'keys':['hello', 'goodbye']})
         assert resp.status_code == 200
 
+    def testStreamingBody(self):
+        produced = []
+
+        def docs():
+            for i in range(1000):
+                produced.append(i)
+                yield {'_id': 'doc%04d' % i, 'i': i}
+        resp = self.db.bulk_docs(docs())
+        assert resp.status_code == 201
+        assert resp.request.headers['Transfer-Encoding'] == 'chunked'
+        assert len(produced) == 1000
+        assert len(resp.json()) == 1000
+        # multi-key queries stream their keys too
+        keys = ('doc%04d' % i for i in range(0, 1000, 100))
+        resp = self.db.all_docs().post(params={'keys': keys})
+        assert resp.status_code == 200
+        assert [row['id'] for row in resp.json()['rows']] == \
+            ['doc%04d' % i for i in range(0, 1000, 100)]
+
+    def testCompression(self):
+        db = cloudant.Database('/'.join([self.uri, self.db_name]))
+        compression = db.enable_compression(min_size=1024)
+        docs = [dict(self.test_doc, _id='doc%04d' % i) for i in range(500)]
+        resp = db.bulk_docs(*docs)
+        assert resp.status_code == 201
+        assert resp.request.headers['Content-Encoding'] == 'gzip'
+        assert resp.transfer.sent < resp.transfer.raw_sent
+        assert resp.transfer.raw_received == len(resp.content)
+        # small bodies are sent as they are
+        resp = db.document('small').put(params=self.test_doc)
+        assert resp.status_code == 201
+        assert 'Content-Encoding' not in resp.request.headers
+        # rows are decompressed as they stream
+        rows = list(db.all_docs().iter(params={'include_docs': True}))
+        assert len(rows) == 501
+        stats = compression.stats
+        assert stats['requests'] == 3
+        assert stats['sent'] < stats['raw_sent']
+        assert stats['received'] < stats['raw_received']
+        # and so are changes
+        assert len(list(db.changes())) == 501
+
+    def testCodec(self):
+        decoded = []
+
+        def loads(data):
+            decoded.append(data)
+            return json.loads(data.decode('utf-8'))
+        codec = cloudant.Codec(json.dumps, loads, binary=True)
+        account = cloudant.Account(self.uri, codec=codec)
+        db = account.database(self.db_name)
+        assert db.codec is codec
+        assert db.bulk_docs(self.test_doc, self.test_otherdoc).status_code == 201
+        rows = list(db.all_docs())
+        assert len(rows) == 2
+        changes = list(db.changes(params={'feed': 'continuous', 'limit': 2}))
+        assert len(changes) == 2 and all('id' in change for change in changes)
+        # rows and changes reach the codec as bytes
+        assert len(decoded) >= 4
+        assert all(isinstance(data, bytes) for data in decoded)
+        # so do cached responses
+        db.cache_documents(max_size=10)
+        db['cached'] = self.test_doc
+        db['cached'].get()
+        del decoded[:]
+        response = db['cached'].get()
+        assert response.from_cache and response.json()['herp'] == 'derp'
+        assert len(decoded) == 1
+        # unavailable codecs fall back on the standard library
+        assert cloudant.get_codec(('no_such_json', 'json')) is cloudant.get_codec()
+
+    def testBulkGet(self):
+        doc = self.db.document('a')
+        first = doc.put(params={'n': 1}).json()['rev']
+        second = doc.put(params={'n': 2, '_rev': first}).json()['rev']
+        assert self.db.document('b').put(params={'n': 3}).status_code == 201
+        pairs = [('a', first), ('a', second), 'b', ('missing', '1-abc')]
+        # once through `_bulk_get`, and once through `open_revs`
+        for supported in (None, False):
+            self.db._bulk_get_supported = supported
+            results = list(self.db.bulk_get(pairs, chunk_size=2))
+            assert [(id, rev) for id, rev, _ in results[:2]] == [('a', first), ('a', second)]
+            assert [doc['n'] for _, _, doc in results[:3]] == [1, 2, 3]
+            assert results[3][0] == 'missing' and results[3][2] is cloudant.MISSING
+        assert self.db._bulk_get_supported is False
+
+    def testDumpLoad(self):
+        docs = [{'_id': 'doc%03d' % i, 'i': i} for i in range(60)]
+        assert self.db.bulk_docs(*docs).status_code == 201
+        copy = cloudant.Database('/'.join([self.uri, self.db_name + '-copy']))
+        copy.put().raise_for_status()
+        try:
+            f = io.BytesIO()
+            reports = []
+            progress = self.db.dump(f, partitions=3, progress=reports.append)
+            assert progress.docs == 60 and progress.last_id == 'doc059'
+            assert reports[-1] is progress
+            f.seek(0)
+            progress = copy.load(f, batch_size=25, concurrency=2)
+            assert progress.docs == 60 and not progress.errors
+            original = [(row['id'], row['value']['rev']) for row in self.db.all_docs()]
+            assert [(row['id'], row['value']['rev']) for row in copy.all_docs()] == original
+            # loading the same revisions again changes nothing
+            f.seek(0)
+            assert not copy.load(f).errors
+
+            # a dump cut off mid-write resumes after its last complete document
+            path = os.path.join(tempfile.mkdtemp(), 'dump.ndjson.gz')
+            with open(path, 'wb') as out:
+                self.db.dump(out)
+            with open(path, 'rb+') as out:
+                out.truncate(os.path.getsize(path) // 2)
+            after = cloudant.backup.last_id(path)
+            assert after < 'doc059'
+            with open(path, 'ab') as out:
+                progress = self.db.dump(out, after=after)
+            with open(path, 'rb') as out:
+                ids = [json.loads(line.decode('utf-8'))['_id'] for line in gzip.GzipFile(fileobj=out)]
+            assert ids == [doc['_id'] for doc in docs]
+            assert progress.docs == 59 - int(after[3:])
+        finally:
+            copy.delete()
+
+    def testDumpWithoutAttachments(self):
+        assert self.db.document('plain').put(params={'n': 1}).status_code == 201
+        assert self.db.document('attached').put(params={'n': 2, '_attachments': {
+            'a.txt': {'content_type': 'text/plain', 'data': 'aGVsbG8='}
+        }}).status_code == 201
+        copy = cloudant.Database('/'.join([self.uri, self.db_name + '-copy']))
+        copy.put().raise_for_status()
+        try:
+            f = io.BytesIO()
+            assert self.db.dump(f).dropped_attachments == 1
+            f.seek(0)
+            progress = copy.load(f)
+            assert progress.new_revisions == 1 and not progress.errors
+            original = dict((row['id'], row['value']['rev']) for row in self.db.all_docs())
+            revs = dict((row['id'], row['value']['rev']) for row in copy.all_docs())
+            # the copy without attachments can't claim the original's revision
+            assert revs['plain'] == original['plain']
+            assert revs['attached'] != original['attached']
+            assert '_attachments' not in copy.document('attached').get().json()
+        finally:
+            copy.delete()
+
+    def testBulkGetErrors(self):
+        response = requests.Response()
+        response.status_code = 400
+        response.reason = 'Bad Request'
+        response.url = self.db.uri + '/_bulk_get'
+        # CouchDB 1.x takes `_bulk_get` for a document ID
+        response._content = b'{"error": "illegal_docid", "reason": "Only reserved IDs may start with underscore."}'
+        assert cloudant.database._lacks_bulk_get(response, self.db.codec)
+        # other bad requests are errors, not a missing endpoint
+        response._content = b'{"error": "bad_request", "reason": "Invalid rev format"}'
+        assert not cloudant.database._lacks_bulk_get(response, self.db.codec)
+        self.db.post = lambda *args, **kwargs: response
+        self.assertRaises(requests.HTTPError, list, self.db.bulk_get([('a', 'bad')]))
+        assert self.db._bulk_get_supported is None
+
+    def testFind(self):
+        docs = [{'_id': 'doc%02d' % i, 'type': 'even' if i % 2 else 'odd', 'i': i}
+                for i in range(50)]
+        assert self.db.bulk_docs(*docs).status_code == 201
+        try:
+            list(self.db.find({'type': 'odd'}))
+        except cloudant.UnindexedQueryError:
+            pass
+        else:
+            assert False, 'should refuse to scan every document'
+        assert self.db.explain({'type': 'odd'}).json()['index']['name'] == '_all_docs'
+
+        resp = self.db.create_index(['type'], name='by-type', ddoc='queries')
+        assert resp.status_code == 200
+        assert self.db.explain({'type': 'odd'}).json()['index']['name'] == 'by-type'
+        names = [index['name'] for index in self.db.list_indexes().json()['indexes']]
+        assert 'by-type' in names
+
+        query = self.db.find({'type': 'odd'}, fields=['_id', 'i'], page_size=10)
+        found = list(query)
+        assert [doc['i'] for doc in found] == list(range(0, 50, 2))
+        assert set(found[0]) == set(['_id', 'i'])
+        assert query.docs_read == 25
+        # resume from a bookmark, up to a limit
+        query = self.db.find({'type': 'odd'}, page_size=10, limit=15)
+        assert len(list(query)) == 15
+        resumed = self.db.find({'type': 'odd'}, page_size=10, limit=5,
+                               bookmark=query.bookmark)
+        assert [doc['i'] for doc in resumed] == list(range(30, 40, 2))
+
+        assert self.db.delete_index('_design/queries', 'by-type').status_code == 200
+        assert len(list(self.db.find({'type': 'odd'}, allow_scan=True))) == 25
+
+    def testJSONStream(self):
+        body = cloudant.stream.JSONStream(
+            {'a': 1, 'docs': (doc for doc in [{'b': 2}, {'c': [3]}])}, chunk_size=4)
+        chunks = list(body)
+        assert len(chunks) > 1
+        assert json.loads(b''.join(chunks).decode('utf-8')) == \
+            {'a': 1, 'docs': [{'b': 2}, {'c': [3]}]}
+
     def testChanges(self):
         assert isinstance(self.db.changes(), GeneratorType)
 
+    def testChangesNormal(self):
+        self.db.bulk_docs(self.test_doc, self.test_otherdoc)
+        seqs = []
+        changes = list(self.db.changes(on_last_seq=seqs.append))
+        assert len(changes) == 2
+        assert all('id' in change for change in changes)
+        assert seqs == [changes[-1]['seq']]
+
     def testChangesContinuous(self):
         def iterator(iterable):
             _iterable = iter(iterable)
@@ -220,6 +695,143 @@ class DatabaseTest(ResourceTest):
         except Exception:
             assert stack[-1] is None
 
+    def testFollow(self):
+        self.db.bulk_docs({'_id': 'a'}, {'_id': 'b'}, {'_id': 'c'})
+        path = os.path.join(tempfile.mkdtemp(), 'checkpoint.json')
+        store = cloudant.FileCheckpoint(path)
+
+        ids = []
+        follower = self.db.follow(store, checkpoint_every=1, heartbeat=500)
+        for change in follower:
+            ids.append(change['id'])
+            if len(ids) == 2:
+                follower.stop()
+        assert ids == ['a', 'b']
+        assert store.load() == follower.seq
+
+        # resumes after the last processed change
+        self.db['d'] = {}
+        follower = self.db.follow(store, heartbeat=500)
+        for change in follower:
+            ids.append(change['id'])
+            if len(ids) == 4:
+                follower.stop()
+        assert ids == ['a', 'b', 'c', 'd']
+
+    def testFollowDroppedConnection(self):
+        since = []
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                query = self.path.partition('?')[2]
+                seq = [int(p[6:]) for p in query.split('&') if p.startswith('since=')]
+                since.append(seq[0] if seq else None)
+                self.send_response(200)
+                self.send_header('Transfer-Encoding', 'chunked')
+                self.end_headers()
+                start = seq[0] if seq else 0
+                for n in range(start + 1, start + 3):
+                    line = json.dumps({'seq': n, 'id': 'doc%d' % n}).encode('utf-8') + b'\n'
+                    self.wfile.write(b'%x\r\n' % len(line) + line + b'\r\n')
+                # drop the connection partway through a chunk
+                self.wfile.write(b'40\r\n{"seq":')
+                self.wfile.flush()
+                self.close_connection = True
+
+        server = HTTPServer(('127.0.0.1', 0), Handler)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        try:
+            db = cloudant.Database('http://127.0.0.1:%d/db' % server.server_port)
+            ids = []
+            follower = db.follow(backoff=0.01, heartbeat=500)
+            for change in follower:
+                ids.append(change['id'])
+                if len(ids) == 4:
+                    follower.stop()
+        finally:
+            server.shutdown()
+            server.server_close()
+        assert ids == ['doc1', 'doc2', 'doc3', 'doc4']
+        assert since == [None, 2]
+
+    def testFollowEmptyFeed(self):
+        requests_made = []
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                requests_made.append(self.path)
+                body = b'{"last_seq":5}\n'
+                self.send_response(200)
+                self.send_header('Content-Length', str(len(body)))
+                self.send_header('Connection', 'close')
+                self.end_headers()
+                self.wfile.write(body)
+
+        server = HTTPServer(('127.0.0.1', 0), Handler)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        try:
+            db = cloudant.Database('http://127.0.0.1:%d/db' % server.server_port)
+            follower = db.follow(backoff=0.05, heartbeat=500)
+            reader = threading.Thread(target=list, args=(follower,))
+            reader.start()
+            time.sleep(0.5)
+            follower.stop()
+            reader.join()
+        finally:
+            server.shutdown()
+            server.server_close()
+        # backs off instead of reconnecting in a tight loop
+        assert 1 < len(requests_made) < 10
+        assert 'since=5' in requests_made[-1]
+
+    def testChangesProcessor(self):
+        ids = ['doc%02d' % i for i in range(25)]
+        self.db.bulk_docs(*[{'_id': id, 'i': i} for i, id in enumerate(ids)])
+        self.db['gone'] = {}
+        del self.db['gone']
+        store = cloudant.FileCheckpoint(
+            os.path.join(tempfile.mkdtemp(), 'checkpoint.json'))
+
+        batches = []
+        def callback(changes):
+            batches.append(changes)
+            if sum(len(batch) for batch in batches) == len(ids) + 1:
+                processor.stop()
+
+        processor = cloudant.ChangesProcessor(self.db, callback, store,
+                                              batch_size=10, max_wait=0.2)
+        processor.run()
+        assert max(len(batch) for batch in batches) == 10
+        changes = dict((change['id'], change) for batch in batches for change in batch)
+        assert changes['doc05']['doc']['i'] == 5
+        assert changes['gone']['doc'] is None
+        assert store.load() == processor.seq
+
+    def testLocalDocumentCheckpoint(self):
+        store = cloudant.LocalDocumentCheckpoint(self.db, 'follower')
+        assert store.load() is None
+        store.save('1-abc')
+        store.save('2-def')
+        assert cloudant.LocalDocumentCheckpoint(self.db, 'follower').load() == '2-def'
+        # fresh instances, as with `since`, save without loading first
+        cloudant.LocalDocumentCheckpoint(self.db, 'follower').save('3-ghi')
+        cloudant.LocalDocumentCheckpoint(self.db, 'follower').save('4-jkl')
+        assert store.load() == '4-jkl'
+
     def testViewCleanup(self):
         assert self.db.view_cleanup().status_code == 202
 
@@ -263,13 +875,105 @@ class DocumentTest(ResourceTest):
         # test merge
         assert self.doc.merge(self.test_otherdoc).status_code == 201
 
+    def testMergeConflict(self):
+        assert self.doc.put(params=self.test_doc).status_code == 201
+
+        def merge(n):
+            responses.append(self.db.document(self.doc_name).merge(
+                {'n%d' % n: n}, retries=10, backoff=0.01))
+        responses = []
+        threads = [threading.Thread(target=merge, args=(n,)) for n in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert [response.status_code for response in responses] == [201] * 5
+        doc = self.doc.get().json()
+        assert [doc['n%d' % n] for n in range(5)] == list(range(5))
+
     def testAttachment(self):
         self.doc.attachment('file')
 
+    def testPutWithAttachments(self):
+        data = os.urandom(100000)
+        response = self.doc.put_with_attachments(self.test_doc, {
+            'data.bin': io.BytesIO(data),
+            'notes.txt': (b'Sunny', 'text/plain')
+        })
+        assert response.status_code == 201
+        doc = self.doc.get().json()
+        assert doc['herp'] == 'derp'
+        assert doc['_attachments']['data.bin']['length'] == len(data)
+        assert doc['_attachments']['notes.txt']['content_type'] == 'text/plain'
+        assert self.doc.attachment('data.bin').get().content == data
+
+    def testReplaceWithAttachments(self):
+        assert self.doc.put_with_attachments(self.test_doc, OrderedDict([
+            ('a.txt', b'old a'),
+            ('b.txt', b'old b')
+        ])).status_code == 201
+        # replaces an existing attachment after a new one
+        doc = self.doc.get().json()
+        assert self.doc.put_with_attachments(doc, OrderedDict([
+            ('c.txt', b'new c'),
+            ('a.txt', b'new a, longer')
+        ])).status_code == 201
+        response = self.doc.get(attachments=True)
+        assert response.attachments == {'a.txt': b'new a, longer', 'b.txt': b'old b',
+                                        'c.txt': b'new c'}
+
+    def testGetWithAttachments(self):
+        data = os.urandom(100000)
+        assert self.doc.put_with_attachments(self.test_doc, {
+            'data.bin': data,
+            'notes.txt': b'Sunny'
+        }).status_code == 201
+        response = self.doc.get(attachments=True)
+        assert response.status_code == 200
+        assert response.attachments == {'data.bin': data, 'notes.txt': b'Sunny'}
+        doc = response.json()
+        assert doc['herp'] == 'derp'
+        assert doc['_attachments']['data.bin']['data'] == data
+
     def testNoLoginLogout(self):
         assert not hasattr(self.doc, 'login')
         assert not hasattr(self.doc, 'logout')
 
+    def testCache(self):
+        cache = self.db.cache_documents(max_size=1)
+        doc = self.db.document(self.doc_name)
+        assert doc.put(params=self.test_doc).status_code == 201
+        assert doc.get().json()['herp'] == 'derp'
+        response = doc.get()
+        assert response.from_cache
+        assert response.json()['herp'] == 'derp'
+        assert (cache.hits, cache.misses, cache.revalidations) == (1, 1, 1)
+        # writes invalidate
+        assert doc.merge({'herp': 'herp'}).status_code == 201
+        assert doc.get().json()['herp'] == 'herp'
+        # so do changes from elsewhere
+        other = cloudant.Database(self.db.uri).document(self.doc_name)
+        assert other.merge({'herp': 'merp'}).status_code == 201
+        list(self.db.changes())
+        assert len(cache) == 0
+        assert doc.get().json()['herp'] == 'merp'
+        # least recently used documents are evicted
+        otherdoc = self.db.document(self.otherdoc_name)
+        assert otherdoc.put(params=self.test_otherdoc).status_code == 201
+        otherdoc.get()
+        assert cache.evictions == 1 and len(cache) == 1
+
+    def testCacheTTL(self):
+        cache = self.db.cache_documents(ttl=60, revalidate=False)
+        self.db[self.doc_name] = self.test_doc
+        doc = self.db[self.doc_name]
+        doc.get()
+        other = cloudant.Database(self.db.uri).document(self.doc_name)
+        assert other.merge({'herp': 'merp'}).status_code == 201
+        # served without asking the server
+        assert doc.get().json()['herp'] == 'derp'
+        assert cache.stats['hits'] == 1 and cache.stats['revalidations'] == 0
+
     def tearDown(self):
         assert self.db.delete().status_code == 200
 
@@ -288,6 +992,25 @@ class DesignTest(ResourceTest):
         self.doc.view('derp')
         self.doc.search('derp')
 
+    def testSearch(self):
+        docs = [{'_id': 'doc%02d' % i, 'kind': 'even' if i % 2 else 'odd'}
+                for i in range(45)]
+        assert self.db.bulk_docs(*docs).status_code == 201
+        search = self.doc.search('by_kind')
+        assert isinstance(search, cloudant.SearchIndex)
+        params = {'q': 'kind:odd', 'include_docs': True, 'limit': 10,
+                  'counts': ['kind']}
+        rows = list(search.iter(params=params))
+        assert [row['id'] for row in rows] == ['doc%02d' % i for i in range(0, 45, 2)]
+        assert all(row['doc']['kind'] == 'odd' for row in rows)
+        assert search.metadata['total_rows'] == 23
+        assert search.metadata['counts'] == {'kind': {'odd': 23}}
+        assert search.bookmark
+        # grouped results arrive as groups, with their own rows
+        groups = list(search.iter(params={'q': '*:*', 'group_field': 'kind'}))
+        assert [group['by'] for group in groups] == ['even', 'odd']
+        assert sum(len(group['rows']) for group in groups) == 45
+
     def testList(self):
         # todo: test on actual list and show functions
         assert self.doc.list('herp', 'derp').status_code == 404
@@ -298,7 +1021,59 @@ class DesignTest(ResourceTest):
 
 
 class AttachmentTest(ResourceTest):
-    pass
+
+    def setUp(self):
+        super(AttachmentTest, self).setUp()
+        self.db = cloudant.Database('/'.join([self.uri, self.db_name]))
+        assert self.db.put().status_code == 201
+        self.doc = self.db.document(self.doc_name)
+        self.data = os.urandom(200000)
+        fd, self.path = tempfile.mkstemp()
+        with os.fdopen(fd, 'wb') as f:
+            f.write(self.data)
+
+    def testUpload(self):
+        attachment = self.doc.attachment('file')
+        response = attachment.upload(self.path, 'application/octet-stream')
+        assert response.status_code == 201
+        assert attachment.get().content == self.data
+        rev = response.json()['rev']
+        with open(self.path, 'rb') as f:
+            f.seek(100)
+            response = attachment.upload(f, 'text/plain', rev=rev)
+        assert response.status_code == 201
+        response = attachment.get()
+        assert response.content == self.data[100:]
+        assert response.headers['Content-Type'] == 'text/plain'
+
+    def testDownload(self):
+        attachment = self.doc.attachment('file')
+        assert attachment.upload(self.path).status_code == 201
+        path = self.path + '.download'
+        try:
+            assert attachment.download(path, chunk_size=1000) == len(self.data)
+            with open(path, 'rb') as f:
+                assert f.read() == self.data
+        finally:
+            os.remove(path)
+
+    def testOpen(self):
+        attachment = self.doc.attachment('file')
+        assert attachment.upload(self.path).status_code == 201
+        with attachment.open(buffer_size=1024) as f:
+            assert f.raw.size == len(self.data)
+            assert f.read(10) == self.data[:10]
+            f.seek(150000)
+            assert f.read(100) == self.data[150000:150100]
+            f.seek(-50, os.SEEK_END)
+            assert f.read() == self.data[-50:]
+            assert f.read() == b''
+            f.seek(10)
+            assert f.read() == self.data[10:]
+
+    def tearDown(self):
+        os.remove(self.path)
+        assert self.db.delete().status_code == 200
 
 
 class IndexTest(ResourceTest):
@@ -323,6 +1098,160 @@ class IndexTest(ResourceTest):
         for derp in self.db.all_docs().iter(params=dict(descending=True, reduce=False)):
             assert docs.pop() == derp['id']
 
+    def testQueryCache(self):
+        assert self.db.bulk_docs(
+            self.test_doc, self.test_otherdoc).status_code == 201
+        cache = self.db.cache_queries(max_size=2, check_interval=0)
+        index = self.db.all_docs()
+        first = index.get(params={'descending': True}).json()
+        response = index.get(params={'descending': True})
+        assert response.from_cache
+        assert response.json() == first
+        assert len(list(self.db.all_docs().iter(params={'descending': True}))) == 2
+        assert (cache.hits, cache.misses) == (2, 1)
+        # a write moves the database's sequence along
+        assert self.db.post(params=self.test_doc).status_code == 201
+        assert len(index.get(params={'descending': True}).json()['rows']) == 3
+        assert cache.misses == 2
+        # the least recently used query is evicted
+        index.get(params={'limit': 1})
+        index.get(params={'limit': 2})
+        assert cache.stats['evictions'] == 1 and cache.stats['size'] == 2
+
+    def testQueryCacheSystemDatabase(self):
+        users = cloudant.Database('/'.join([self.uri, '_users']))
+        assert users.put().status_code in (201, 412)
+        cache = users.cache_queries(check_interval=0)
+        assert users.all_docs().database_uri == users.uri
+        assert users.design('ddoc').view('view').database_uri == users.uri
+        index = users.all_docs()
+        first = index.get(params={'limit': 1}).json()
+        assert index.get(params={'limit': 1}).json() == first
+        assert cache.hits == 1
+
+    def testMetadata(self):
+        assert self.db.bulk_docs(
+            self.test_doc, self.test_otherdoc).status_code == 201
+        index = self.db.all_docs()
+        assert index.total_rows is None
+        rows = list(index.iter(params=dict(update_seq=True)))
+        assert len(rows) == 2
+        assert index.total_rows == 2
+        assert index.offset == 0
+        assert index.update_seq is not None
+
+    def testPaginate(self):
+        ids = ['doc%d' % i for i in range(7)]
+        assert self.db.bulk_docs(
+            *[{'_id': id} for id in ids]).status_code == 201
+
+        pages = self.db.all_docs().paginate(page_size=3)
+        assert [len(page) for page in pages.pages()] == [3, 3, 1]
+        assert pages.cursor == {'done': True}
+
+        pages = self.db.all_docs().paginate(page_size=2, startkey='doc1',
+                                            endkey='doc5')
+        rows = iter(pages)
+        assert [next(rows)['id'] for i in range(3)] == ids[1:4]
+        # the cursor marks the start of the page being consumed
+        cursor = json.loads(json.dumps(pages.cursor))
+        assert cursor['startkey'] == 'doc3'
+
+        resumed = self.db.all_docs().paginate(page_size=2, cursor=cursor,
+                                              endkey='doc5')
+        assert [row['id'] for row in resumed] == ids[3:6]
+
+        pages = self.db.all_docs().paginate(page_size=2, limit=3,
+                                            descending=True)
+        assert [row['id'] for row in pages] == ids[:-4:-1]
+
+        # keys are encoded with the database's codec
+        encoded = []
+
+        def dumps(obj):
+            encoded.append(obj)
+            return json.dumps(obj)
+        db = cloudant.Database(self.db.uri, codec=cloudant.Codec(dumps))
+        pages = db.all_docs().paginate(page_size=2, startkey='doc1', endkey='doc3')
+        assert [row['id'] for row in pages] == ids[1:4]
+        assert 'doc1' in encoded and 'doc3' in encoded
+
+    def testParallelScan(self):
+        ids = ['%03d' % i for i in range(100)]
+        assert self.db.bulk_docs(
+            *[{'_id': id, 'even': i % 2 == 0} for i, id in enumerate(ids)]).status_code == 201
+
+        scan = self.db.all_docs().parallel_scan(partitions=4, workers=2)
+        assert len(scan.ranges()) > 1
+        assert [row['id'] for row in scan] == ids
+
+        index = self.db.all_docs()
+        probes = []
+        get = index.get
+
+        def record(*args, **kwargs):
+            probes.append(kwargs.get('params', {}))
+            return get(*args, **kwargs)
+        index.get = record
+        scan = index.parallel_scan(partitions=4, ordered=False,
+                                   startkey='010', endkey='089')
+        rows = list(scan)
+        # probes never ask CouchDB for a reversed key range
+        assert not [params for params in probes if 'startkey' in params and
+                    'endkey' in params and
+                    json.loads(params['startkey']) > json.loads(params['endkey'])]
+        assert sorted(row['id'] for partition, row in rows) == ids[10:90]
+        assert len(set(partition for partition, row in rows)) > 1
+
+        design = self.db.design('scan')
+        assert design.put(params={'views': {'even': {
+            'map': 'function (doc) { emit(doc.even, null); }'
+        }}}).status_code == 201
+        view = design.view('even')
+        scan = view.parallel_scan(partitions=3, include_docs=True)
+        rows = list(scan)
+        assert len(scan.ranges()) == 3
+        assert [row['id'] for row in rows] == [id for id in ids[1::2] + ids[::2]]
+        assert all('doc' in row for row in rows)
+
+        # keys are encoded with the database's codec
+        encoded = []
+
+        def dumps(obj):
+            encoded.append(obj)
+            return json.dumps(obj)
+        db = cloudant.Database(self.db.uri, codec=cloudant.Codec(dumps))
+        scan = db.all_docs().parallel_scan(partitions=2, startkey='010', endkey='020')
+        assert [row['id'] for row in scan] == ids[10:21]
+        assert '010' in encoded and '020' in encoded
+
+    def testToColumns(self):
+        assert self.db.bulk_docs(*[
+            {'month': [2014, i % 12 + 1], 'amount': i}
+            for i in range(36)]).status_code == 201
+        design = self.db.design('columns')
+        assert design.put(params={'views': {'by_month': {
+            'map': 'function (doc) { emit(doc.month, doc.amount); }',
+            'reduce': '_sum'
+        }}}).status_code == 201
+        view = design.view('by_month')
+        columns = view.to_columns(['key.1', 'value'], params={'group_level': 2})
+        assert list(columns) == ['key.1', 'value']
+        assert list(columns['key.1']) == list(range(1, 13))
+        assert list(columns['value']) == [3 * i + 36 for i in range(12)]
+        assert columns['value'].typecode == 'd'
+
+        columns = view.to_columns(['key.2', 'value'], typecode={'key.2': 'd', 'value': 'l'},
+                                  params={'group_level': 1})
+        assert math.isnan(columns['key.2'][0])
+        assert list(columns['value']) == [sum(range(36))]
+        self.assertRaises(ValueError, view.to_columns, 'key.2', typecode='l',
+                          params={'group_level': 1})
+
+        columns = view.to_columns(['id', 'value'], typecode={'id': None},
+                                  params={'reduce': False, 'limit': 3})
+        assert isinstance(columns['id'], list) and len(columns['id']) == 3
+
     def testQueryParams(self):
         view = self.db.all_docs()
         response = view.get(params=dict(reduce=False))
@@ -350,6 +1279,50 @@ class IndexTest(ResourceTest):
         assert self.db.delete().status_code == 200
 
 
+class StreamTest(unittest.TestCase):
+
+    def setUp(self):
+        self.rows = [
+            {'id': 'a', 'key': ['x]}', 1], 'value': {'rev': '1-a'}},
+            {'id': 'b', 'key': 'line\nbreak', 'value': None,
+             'doc': {'name': u'\u00e9\u4e2d', 'escaped': '"\\'}}
+        ]
+        self.response = {'total_rows': 2, 'offset': 0, 'rows': self.rows}
+
+    def chunks(self, data, size):
+        return [data[i:i + size] for i in range(0, len(data), size)]
+
+    def testRows(self):
+        for indent in [None, 2]:
+            data = json.dumps(self.response, indent=indent).encode('utf-8')
+            for size in [1, 7, len(data)]:
+                parser = cloudant.stream.RowParser('rows')
+                assert list(parser.parse(self.chunks(data, size))) == self.rows
+                assert parser.metadata == {'total_rows': 2, 'offset': 0}
+
+    def testEmpty(self):
+        parser = cloudant.stream.RowParser('rows')
+        assert list(parser.parse([b'{"total_rows":0,"rows":[\r\n\r\n]}\n'])) == []
+        assert parser.metadata['total_rows'] == 0
+
+    def testLines(self):
+        chunks = [b'{"seq":1}\n', b'\n', b'{"se', b'q":2}\r\n{"seq":3}', b'\n{"last_seq":3}']
+        lines = list(cloudant.stream.iter_lines(chunks))
+        assert lines == [b'{"seq":1}', b'', b'{"seq":2}', b'{"seq":3}', b'{"last_seq":3}']
+
+    def testMalformed(self):
+        data = json.dumps(self.response).encode('utf-8')
+        for bad in [data[:-1], data[:-10], data + b'{}',
+                    b'{"rows":[{"a":1} {"b":2}]}', b'{"rows":[tru]}', b'[]']:
+            parser = cloudant.stream.RowParser('rows')
+            try:
+                list(parser.parse(self.chunks(bad, 5)))
+            except cloudant.stream.ParseError:
+                pass
+            else:
+                assert False, 'should have failed to parse %r' % bad
+
+
 class ErrorTest(ResourceTest):
 
     def setUp(self):